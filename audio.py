@@ -0,0 +1,552 @@
+import math
+import threading
+import time
+import wave
+
+import numpy as np
+
+try:
+    import av
+except ImportError:
+    # Optional: without PyAV there is no Opus, calls fall back to mu-law
+    av = None
+
+try:
+    import sounddevice
+except ImportError:
+    # Optional: without it only the file/sine sources and the null sink are available
+    sounddevice = None
+
+# Everything in the audio path is 48 kHz mono 16-bit PCM in 20 ms frames
+SAMPLE_RATE = 48000
+FRAME_MS = 20
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+# After this long without a real frame (muted, gone) a stream's audio clock stops counting
+AUDIO_CLOCK_TIMEOUT = 0.5
+
+# Packet-loss concealment: how many frames to fill from the last good one, and how fast it fades
+MAX_CONCEAL_FRAMES = 5
+CONCEAL_FADE = 0.7
+
+def silence():
+    return np.zeros(FRAME_SAMPLES, dtype=np.int16)
+
+
+class SineSource:
+    """
+    A test tone, for running calls headless with no sound hardware.
+    """
+    realtime = False
+
+    def __init__(self, frequency=440.0, amplitude=0.2):
+        self.step = 2 * math.pi * frequency / SAMPLE_RATE
+        self.amplitude = amplitude * 32767
+        self.phase = 0.0
+
+    def read(self):
+        phases = self.phase + self.step * np.arange(FRAME_SAMPLES)
+        self.phase = (self.phase + self.step * FRAME_SAMPLES) % (2 * math.pi)
+        return (np.sin(phases) * self.amplitude).astype(np.int16)
+
+    def close(self):
+        pass
+
+
+class FileSource:
+    """
+    Plays a 16-bit WAV file as the microphone, looping at the end.
+    Other sample rates and channel counts are converted on load.
+    """
+    realtime = False
+
+    def __init__(self, path, loop=True):
+        with wave.open(path, "rb") as wav:
+            if wav.getsampwidth() != 2:
+                raise ValueError("Only 16-bit WAV files are supported")
+            rate = wav.getframerate()
+            channels = wav.getnchannels()
+            samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+        if channels > 1:
+            samples = samples.reshape(-1, channels).mean(axis=1)
+        if rate != SAMPLE_RATE:
+            positions = np.arange(0, len(samples), rate / SAMPLE_RATE)
+            samples = np.interp(positions, np.arange(len(samples)), samples)
+        self.samples = samples.astype(np.int16)
+        self.loop = loop
+        self.position = 0
+
+    def read(self):
+        frame = self.samples[self.position:self.position + FRAME_SAMPLES]
+        self.position += FRAME_SAMPLES
+        if len(frame) < FRAME_SAMPLES:
+            if self.loop and len(self.samples):
+                self.position = FRAME_SAMPLES - len(frame)
+                frame = np.concatenate([frame, self.samples[:self.position]])
+            else:
+                frame = np.concatenate([frame, silence()[len(frame):]])
+        return frame
+
+    def close(self):
+        pass
+
+
+class MicrophoneSource:
+    """
+    The default input device, through sounddevice. Reads block for one frame.
+    """
+    realtime = True
+
+    def __init__(self):
+        if sounddevice is None:
+            raise ValueError("sounddevice is not installed")
+        self.stream = sounddevice.InputStream(samplerate=SAMPLE_RATE, channels=1, dtype="int16",
+                                              blocksize=FRAME_SAMPLES)
+        self.stream.start()
+
+    def read(self):
+        data, overflowed = self.stream.read(FRAME_SAMPLES)
+        return data.reshape(-1)
+
+    def close(self):
+        self.stream.stop()
+        self.stream.close()
+
+
+class NullSink:
+    """
+    Discards playback (headless runs); keeps the level of the last frame for checks.
+    """
+    realtime = False
+
+    def __init__(self):
+        self.frames_written = 0
+        self.level = 0.0
+
+    def write(self, pcm):
+        self.frames_written += 1
+        self.level = float(np.sqrt(np.mean(pcm.astype(np.float32) ** 2)))
+
+    def close(self):
+        pass
+
+
+class WaveSink(NullSink):
+    """
+    Records playback to a WAV file.
+    """
+    def __init__(self, path):
+        super().__init__()
+        self.wav = wave.open(path, "wb")
+        self.wav.setnchannels(1)
+        self.wav.setsampwidth(2)
+        self.wav.setframerate(SAMPLE_RATE)
+
+    def write(self, pcm):
+        super().write(pcm)
+        self.wav.writeframes(pcm.tobytes())
+
+    def close(self):
+        self.wav.close()
+
+
+class SpeakerSink:
+    """
+    The default output device, through sounddevice. Writes block until the device has room.
+    """
+    realtime = True
+
+    def __init__(self):
+        if sounddevice is None:
+            raise ValueError("sounddevice is not installed")
+        self.stream = sounddevice.OutputStream(samplerate=SAMPLE_RATE, channels=1, dtype="int16",
+                                               blocksize=FRAME_SAMPLES)
+        self.stream.start()
+
+    def write(self, pcm):
+        self.stream.write(pcm)
+
+    def close(self):
+        self.stream.stop()
+        self.stream.close()
+
+
+def open_source(spec=None):
+    """
+    Builds a capture source from a setting: None or "mic" for the microphone,
+    "sine" (or "sine:<hz>") for a test tone, anything else is a WAV file path.
+    """
+    if spec in (None, "", "mic"):
+        return MicrophoneSource()
+    if spec.startswith("sine"):
+        _, _, frequency = spec.partition(":")
+        return SineSource(float(frequency or 440))
+    return FileSource(spec)
+
+def open_sink(spec=None):
+    """
+    Builds a playback sink: None for the speakers (falling back to a null sink
+    when there are none), "null" to discard, anything else is a WAV file path.
+    """
+    if spec in (None, ""):
+        try:
+            return SpeakerSink()
+        except Exception as e:
+            print(f"Audio playback unavailable: {e}")
+            return NullSink()
+    if spec == "null":
+        return NullSink()
+    return WaveSink(spec)
+
+
+class AudioCodec:
+    """
+    Interface for audio codecs: one 20 ms PCM frame in, one packet out.
+    Instances are stateful, so every stream gets its own decoder.
+    """
+    name = None
+
+    def encode(self, pcm):
+        raise NotImplementedError
+
+    def decode(self, payload):
+        raise NotImplementedError
+
+
+class MuLawCodec(AudioCodec):
+    """
+    Logarithmic 8-bit companding (mu-law curve): halves the bitrate with numpy alone.
+    """
+    name = "mulaw"
+    MU = 255.0
+
+    def encode(self, pcm):
+        x = pcm.astype(np.float32) / 32768.0
+        y = np.sign(x) * np.log1p(self.MU * np.abs(x)) / math.log1p(self.MU)
+        return np.round((y + 1.0) * 127.5).astype(np.uint8).tobytes()
+
+    def decode(self, payload):
+        y = np.frombuffer(payload, dtype=np.uint8).astype(np.float32) / 127.5 - 1.0
+        x = np.sign(y) * np.expm1(np.abs(y) * math.log1p(self.MU)) / self.MU
+        return np.clip(x * 32768.0, -32768, 32767).astype(np.int16)
+
+
+class OpusCodec(AudioCodec):
+    """
+    Opus through PyAV (libopus), tuned for speech. About 32 kbit/s against
+    768 for raw PCM, and the encoder/decoder keep state across frames.
+    """
+    name = "opus"
+
+    def __init__(self, bitrate=32000):
+        if av is None:
+            raise ValueError("Opus needs PyAV (pip install av)")
+        self.bitrate = bitrate
+        self.encoder = None
+        self.decoder = None
+        self.pts = 0
+
+    def encode(self, pcm):
+        if self.encoder is None:
+            self.encoder = av.CodecContext.create("libopus", "w")
+            self.encoder.sample_rate = SAMPLE_RATE
+            self.encoder.layout = "mono"
+            self.encoder.format = "s16"
+            self.encoder.bit_rate = self.bitrate
+            self.encoder.options = {"application": "voip", "frame_duration": str(FRAME_MS)}
+        frame = av.AudioFrame.from_ndarray(pcm.reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = SAMPLE_RATE
+        frame.pts = self.pts
+        self.pts += FRAME_SAMPLES
+        return b"".join(bytes(packet) for packet in self.encoder.encode(frame))
+
+    def decode(self, payload):
+        if self.decoder is None:
+            self.decoder = av.CodecContext.create("libopus", "r")
+            self.decoder.sample_rate = SAMPLE_RATE
+            self.decoder.layout = "mono"
+        frames = [f.to_ndarray().reshape(-1) for f in self.decoder.decode(av.Packet(bytes(payload)))]
+        if not frames:
+            return silence()
+        pcm = np.concatenate(frames)
+        if pcm.dtype != np.int16:
+            pcm = np.clip(pcm * 32768.0, -32768, 32767).astype(np.int16)
+        return pcm
+
+
+AUDIO_CODECS = {codec.name: codec for codec in (OpusCodec, MuLawCodec)}
+
+# Most preferred first
+AUDIO_CODEC_PREFERENCE = ["opus", "mulaw"]
+
+def available_audio_codecs():
+    """
+    Audio codecs usable on this machine, most preferred first.
+    """
+    return [name for name in AUDIO_CODEC_PREFERENCE if name != OpusCodec.name or av is not None]
+
+def create_audio_codec(name):
+    if name not in AUDIO_CODECS:
+        raise ValueError(f"Unknown audio codec: {name}")
+    return AUDIO_CODECS[name]()
+
+def negotiate_audio_codec(receiver_codecs, sender_codecs):
+    """
+    Same rule as video: the receiver's most preferred codec the sender also has.
+    None if they share nothing (e.g. a peer without audio support).
+    """
+    for name in receiver_codecs:
+        if name in sender_codecs and name in AUDIO_CODECS:
+            return name
+    return None
+
+
+class JitterBuffer:
+    """
+    Reorders one stream's packets and holds them back just long enough to ride out
+    network jitter. Jitter is estimated from interarrival times as in RFC 3550
+    (sender clock offset cancels out), and the playout delay follows it between
+    min_delay_ms and max_delay_ms. Written by the network thread, read by playback.
+    """
+    def __init__(self, min_delay_ms=40, max_delay_ms=400):
+        self.lock = threading.Lock()
+        self.min_frames = max(1, min_delay_ms // FRAME_MS)
+        self.max_frames = max(self.min_frames, max_delay_ms // FRAME_MS)
+        self.packets = {} # seq -> (capture timestamp, payload)
+        self.next_seq = None
+        self.buffering = True
+        self.jitter = 0.0
+        self.last_transit = None
+        # Counters
+        self.late = 0
+        self.lost = 0
+        self.underruns = 0
+        self.trimmed = 0
+
+    def target_frames(self):
+        """
+        Frames to hold before playing: one frame plus four times the jitter.
+        """
+        frames = math.ceil((FRAME_MS / 1000 + 4 * self.jitter) * 1000 / FRAME_MS)
+        return min(self.max_frames, max(self.min_frames, frames))
+
+    def delay_ms(self):
+        with self.lock:
+            return len(self.packets) * FRAME_MS
+
+    def push(self, seq, timestamp_us, payload, arrival=None):
+        if arrival is None:
+            arrival = time.time()
+        with self.lock:
+            transit = arrival - timestamp_us / 1_000_000
+            if self.last_transit is not None:
+                self.jitter += (abs(transit - self.last_transit) - self.jitter) / 16
+            self.last_transit = transit
+            if self.next_seq is not None and seq < self.next_seq:
+                # Its turn already came and went
+                self.late += 1
+                return
+            self.packets[seq] = (timestamp_us, payload)
+
+    def pop(self):
+        """
+        Called once per frame period. Returns (payload, timestamp, status): status is
+        "ok", "lost" (a gap: conceal it), "underrun" (ran dry: conceal, then rebuffer)
+        or "buffering" (not started yet: play silence). timestamp is the sender's
+        capture time of the payload, or None without one.
+        """
+        with self.lock:
+            if self.buffering:
+                if len(self.packets) < self.target_frames():
+                    return None, None, "buffering"
+                self.buffering = False
+                self.next_seq = min(self.packets)
+            if not self.packets:
+                self.underruns += 1
+                self.buffering = True
+                return None, None, "underrun"
+            # Latency crept up (e.g. after a burst): drop one frame to shrink it
+            if len(self.packets) > self.target_frames() + 2:
+                if self.packets.pop(self.next_seq, None) is not None:
+                    self.trimmed += 1
+                self.next_seq += 1
+            packet = self.packets.pop(self.next_seq, None)
+            self.next_seq += 1
+            if packet is None:
+                self.lost += 1
+                return None, None, "lost"
+            return packet[1], packet[0], "ok"
+
+
+class AudioCapture:
+    """
+    Reads the source in 20 ms frames on its own thread and hands each one to
+    on_frame(pcm, timestamp). Sources that aren't tied to a device (files, sine)
+    are paced on the monotonic clock so they run in real time.
+    """
+    def __init__(self, source, on_frame=None):
+        self.source = source
+        self.on_frame = on_frame
+        self.muted = False
+        self.running = True
+        self.thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.thread.start()
+
+    def _capture_loop(self):
+        interval = FRAME_MS / 1000
+        deadline = time.monotonic()
+        while self.running:
+            try:
+                pcm = self.source.read()
+            except Exception as e:
+                print(f"Audio Capture Error: {e}")
+                break
+            timestamp = time.monotonic()
+            # Muted frames are still read, so the device doesn't back up
+            if not self.muted and self.on_frame is not None:
+                self.on_frame(pcm, timestamp)
+            if not self.source.realtime:
+                deadline += interval
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -interval:
+                    deadline = time.monotonic()
+
+    def release(self):
+        self.running = False
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        self.source.close()
+
+
+class PlaybackStream:
+    """
+    One remote participant's audio: jitter buffer, decoder and concealment state.
+    """
+    def __init__(self, codec):
+        self.jitter_buffer = JitterBuffer()
+        self.codec = codec
+        self.last_pcm = None
+        self.concealed_run = 0
+        # (sender capture time in us, local monotonic time) of the last real frame played
+        self.clock = None
+
+
+class AudioPlayer:
+    """
+    Plays every remote stream, mixed, through one sink. A thread pulls one frame
+    per 20 ms from each stream's jitter buffer, decodes it, and fills gaps from
+    the last good frame with a fading copy (packet-loss concealment).
+    """
+    def __init__(self, sink=None):
+        self.sink = sink or NullSink()
+        self.codec_name = MuLawCodec.name
+        self.lock = threading.Lock()
+        self.streams = {}
+        self.concealed = 0
+        self.decode_errors = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._playback_loop, daemon=True)
+        self.thread.start()
+
+    def set_codec(self, name):
+        """
+        Codec for streams added from now on (set once per call, after negotiation).
+        """
+        self.codec_name = name
+
+    def add_packet(self, stream_id, seq, timestamp_us, payload):
+        with self.lock:
+            stream = self.streams.get(stream_id)
+            if stream is None:
+                stream = PlaybackStream(create_audio_codec(self.codec_name))
+                self.streams[stream_id] = stream
+        stream.jitter_buffer.push(seq, timestamp_us, bytes(payload))
+
+    def remove_stream(self, stream_id):
+        with self.lock:
+            self.streams.pop(stream_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.streams.clear()
+
+    def clock(self, stream_id):
+        """
+        The sender's capture time (wall clock, microseconds) of the audio this stream
+        is playing right now, for syncing its video to. None if it isn't playing audio.
+        """
+        with self.lock:
+            stream = self.streams.get(stream_id)
+        clock = stream.clock if stream is not None else None
+        if clock is None:
+            return None
+        elapsed = time.monotonic() - clock[1]
+        if elapsed > AUDIO_CLOCK_TIMEOUT:
+            return None
+        return clock[0] + int(elapsed * 1_000_000)
+
+    def _next_pcm(self, stream):
+        payload, timestamp, status = stream.jitter_buffer.pop()
+        if payload is not None:
+            try:
+                pcm = stream.codec.decode(payload)
+            except Exception:
+                self.decode_errors += 1
+                pcm = None
+            if pcm is not None and len(pcm) == FRAME_SAMPLES:
+                stream.last_pcm = pcm
+                stream.concealed_run = 0
+                stream.clock = (timestamp, time.monotonic())
+                return pcm
+            status = "lost"
+        if status == "buffering" or stream.last_pcm is None or stream.concealed_run >= MAX_CONCEAL_FRAMES:
+            return None
+        stream.concealed_run += 1
+        self.concealed += 1
+        return (stream.last_pcm * CONCEAL_FADE ** stream.concealed_run).astype(np.int16)
+
+    def _playback_loop(self):
+        interval = FRAME_MS / 1000
+        deadline = time.monotonic()
+        while self.running:
+            with self.lock:
+                streams = list(self.streams.values())
+            mix = np.zeros(FRAME_SAMPLES, dtype=np.int32)
+            for stream in streams:
+                pcm = self._next_pcm(stream)
+                if pcm is not None:
+                    mix += pcm
+            try:
+                self.sink.write(np.clip(mix, -32768, 32767).astype(np.int16))
+            except Exception as e:
+                print(f"Audio Playback Error: {e}")
+                break
+            if not self.sink.realtime:
+                deadline += interval
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -interval:
+                    deadline = time.monotonic()
+
+    def stats(self):
+        with self.lock:
+            buffers = [stream.jitter_buffer for stream in self.streams.values()]
+        return {
+            "streams": len(buffers),
+            "delay_ms": max((b.delay_ms() for b in buffers), default=0),
+            "jitter_ms": max((b.jitter * 1000 for b in buffers), default=0.0),
+            "late": sum(b.late for b in buffers),
+            "lost": sum(b.lost for b in buffers),
+            "underruns": sum(b.underruns for b in buffers),
+            "trimmed": sum(b.trimmed for b in buffers),
+            "concealed": self.concealed,
+        }
+
+    def release(self):
+        self.running = False
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        self.sink.close()
@@ -0,0 +1,356 @@
+"""
+Headless benchmarks for the call pipeline: no windows, no camera, no sound card.
+
+Two suites:
+- codec: raw encode/decode throughput of each codec on camera-source frames.
+- call: a host and N clients on localhost, each sending a camera-source stream through
+  ConnectionManager; reports end-to-end latency percentiles, frame rates,
+  CPU per stream and memory over time.
+
+Examples:
+    python benchmark.py codec --codecs jpeg,delta,h264 --sizes 640x480,1280x720
+    python benchmark.py call --peers 1,2,4 --codecs jpeg --duration 10 --output bench.jsonl
+    python benchmark.py call --baseline bench.jsonl   # exits 1 on a regression
+    python benchmark.py codec --source test:noise     # worst case for every codec
+
+Frames come from video.open_source(): test patterns by default, so runs are
+repeatable, or a video file / image sequence for real content.
+
+All peers share one process (and one GIL), so absolute numbers are pessimistic;
+compare runs on the same machine.
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+from PyQt6.QtCore import QCoreApplication
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows; memory then comes from /proc only
+    resource = None
+
+import metrics
+import network
+import protocol
+import utils
+import video
+
+# Seconds of traffic ignored before measuring, while codecs settle and keyframes go out
+WARMUP = 2.0
+# Resource sampling interval for the memory/CPU timeline
+SAMPLE_INTERVAL = 1.0
+# Default regression tolerance: 20% worse than the baseline fails the run
+TOLERANCE = 0.2
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+def rss_mb():
+    """
+    Current resident memory of this process in MiB (peak RSS where /proc is missing).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentiles(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1]}
+
+def pump(app, seconds, until=None):
+    """
+    Runs the Qt event loop for up to seconds, or until until() is true.
+    """
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        app.processEvents()
+        if until is not None and until():
+            return True
+        time.sleep(0.005)
+    return until is None
+
+def read_frames(source, width, height, count):
+    """
+    Reads count frames from a camera source up front, at the capture size,
+    so generating or decoding them isn't part of the measurement.
+    """
+    source = video.open_source(source)
+    source.open(width, height)
+    frames = []
+    for _ in range(count):
+        frame = source.read(np.empty((height, width, 3), dtype=np.uint8))
+        if frame is None:
+            break
+        frames.append(utils.fit_size(frame, (width, height)))
+    source.close()
+    if not frames:
+        raise ValueError("Source produced no frames")
+    return frames
+
+def bench_codec(name, width, height, quality, frames=100, source="test:gradient"):
+    """
+    Encodes and decodes frames from source; returns frames/s and sizes.
+    """
+    inputs = read_frames(source, width, height, frames)
+    encoder = utils.create_codec(name)
+    decoder = utils.create_codec(name)
+    payloads = []
+    started = time.perf_counter()
+    for frame in inputs:
+        payload = encoder.encode(frame, quality)
+        if payload is not None:
+            payloads.append(payload)
+    encode_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for payload in payloads:
+        decoder.decode(payload)
+    decode_time = time.perf_counter() - started
+
+    return {
+        "suite": "codec",
+        "codec": name,
+        "source": source,
+        "size": f"{width}x{height}",
+        "quality": quality,
+        "encode_fps": len(inputs) / encode_time,
+        "decode_fps": len(payloads) / decode_time if payloads else None,
+        "mean_bytes": sum(len(p) for p in payloads) / len(payloads) if payloads else 0,
+    }
+
+def bench_call(peers, codec, width, height, quality, fps, duration, warmup=WARMUP, source="test:gradient"):
+    """
+    Runs a host and `peers` clients on localhost for duration seconds (after warmup).
+    Every participant sends one stream (its own VideoCamera on source) and
+    receives everyone else's.
+    """
+    app = QCoreApplication.instance() or QCoreApplication([])
+    port = free_port()
+    # One fixed rung, so adaptive quality doesn't blur the comparison
+    ladder = [network.QualityProfile(width, height, quality, fps)]
+    latencies = []
+    received = [0]
+    measuring = [False]
+    cameras = []
+
+    def make_manager():
+        manager = network.ConnectionManager(fps=fps, codecs=[codec])
+        manager.quality_ladder = ladder
+        manager.quality_start = 0
+        camera = video.VideoCamera(source, width, height, fps)
+        # Test patterns and files run at their own rate; the call's rate wins
+        camera.source.fps = fps
+        cameras.append(camera)
+        manager.set_camera(camera)
+        def on_frame(video_frame, manager=manager):
+            manager.frame_rendered(video_frame)
+            if measuring[0]:
+                received[0] += 1
+                latencies.append((protocol.wall_time_us() - video_frame.timestamp) / 1000)
+        # Direct connection: runs on the network thread, no GUI event loop in between
+        manager.new_frame_received.connect(on_frame)
+        return manager
+
+    host = make_manager()
+    clients = [make_manager() for _ in range(peers)]
+    managers = [host] + clients
+    host.start_host(port)
+    pump(app, 0.3)
+    for client in clients:
+        client.start_client(f"ws://127.0.0.1:{port}")
+    if not pump(app, 5.0, until=lambda: len(host.peers) == peers):
+        for manager in managers:
+            manager.stop_connection()
+        raise RuntimeError(f"Only {len(host.peers)} of {peers} clients connected")
+    pump(app, warmup)
+
+    for manager in managers:
+        manager.metrics.reset()
+    measuring[0] = True
+    timeline = []
+    started = time.monotonic()
+    cpu_started = time.process_time()
+    last_sample = (started, cpu_started)
+    while time.monotonic() - started < duration:
+        pump(app, SAMPLE_INTERVAL)
+        now, cpu = time.monotonic(), time.process_time()
+        timeline.append({
+            "t": round(now - started, 2),
+            "cpu_percent": (cpu - last_sample[1]) / (now - last_sample[0]) * 100,
+            "rss_mb": rss_mb(),
+        })
+        last_sample = (now, cpu)
+    measuring[0] = False
+    elapsed = time.monotonic() - started
+    cpu_percent = (time.process_time() - cpu_started) / elapsed * 100
+    snapshots = [manager.get_stats() for manager in managers]
+
+    for manager in managers:
+        manager.stop_connection()
+    for manager in managers:
+        if manager.thread is not None:
+            manager.thread.join(timeout=2.0)
+    for camera in cameras:
+        camera.release()
+    pump(app, 0.2)
+
+    def mean_p50(stage):
+        values = [s[f"{stage}_ms"]["p50"] for s in snapshots if s[f"{stage}_ms"]]
+        return sum(values) / len(values) if values else None
+
+    participants = peers + 1
+    streams_received = participants * peers
+    frames_sent = sum(s["counters"].get("frames_out", 0) for s in snapshots)
+    return {
+        "suite": "call",
+        "codec": codec,
+        "source": source,
+        "peers": peers,
+        "size": f"{width}x{height}",
+        "quality": quality,
+        "fps": fps,
+        "duration": elapsed,
+        "encode_fps": frames_sent / elapsed,
+        "decode_fps": received[0] / elapsed,
+        "fps_per_stream": received[0] / elapsed / streams_received,
+        "e2e_ms": percentiles(latencies),
+        "encode_ms_p50": mean_p50("encode"),
+        "decode_ms_p50": mean_p50("decode"),
+        "cpu_percent": cpu_percent,
+        # Every participant encodes one stream and decodes the others
+        "cpu_per_stream": cpu_percent / (participants + streams_received),
+        "rss_mb_max": max((s["rss_mb"] for s in timeline if s["rss_mb"] is not None), default=None),
+        "dropped": {key: sum(s["dropped"][key] for s in snapshots) for key in snapshots[0]["dropped"]},
+        "timeline": timeline,
+    }
+
+def scenario_key(result):
+    return (result["suite"], result["codec"], result.get("source"), result.get("peers"),
+            result["size"], result["quality"], result.get("fps"))
+
+# Metric -> True if higher is better
+REGRESSION_CHECKS = {
+    "encode_fps": True,
+    "decode_fps": True,
+    "cpu_per_stream": False,
+    "e2e_p95": False,
+}
+
+def check_regressions(results, baseline_path, tolerance=TOLERANCE):
+    """
+    Compares results with a previous --output file; returns a list of regressions.
+    """
+    baseline = {}
+    with open(baseline_path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                baseline[scenario_key(entry)] = entry
+
+    def value(result, name):
+        if name == "e2e_p95":
+            return (result.get("e2e_ms") or {}).get("p95")
+        return result.get(name)
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(scenario_key(result))
+        if previous is None:
+            continue
+        for name, higher_is_better in REGRESSION_CHECKS.items():
+            old, new = value(previous, name), value(result, name)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{scenario_key(result)} {name}: {old:.2f} -> {new:.2f} ({change:+.0%})")
+    return regressions
+
+def report(result):
+    if result["suite"] == "codec":
+        decode = f"{result['decode_fps']:7.1f}" if result["decode_fps"] else "      -"
+        print(f"{result['codec']:6} {result['size']:>9} q{result['quality']:<3} "
+              f"encode {result['encode_fps']:7.1f} fps  decode {decode} fps  "
+              f"{result['mean_bytes'] / 1024:7.1f} KB/frame")
+    else:
+        e2e = result["e2e_ms"] or {}
+        print(f"{result['codec']:6} {result['size']:>9} q{result['quality']:<3} {result['fps']:>2} fps "
+              f"{result['peers']:>2} peers  e2e p50 {e2e.get('p50', 0):6.1f} p95 {e2e.get('p95', 0):6.1f} "
+              f"p99 {e2e.get('p99', 0):6.1f} ms  {result['fps_per_stream']:5.1f} fps/stream  "
+              f"cpu/stream {result['cpu_per_stream']:5.1f}%  rss {result['rss_mb_max'] or 0:6.1f} MB")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless call pipeline benchmarks")
+    parser.add_argument("suite", choices=["codec", "call", "all"])
+    parser.add_argument("--codecs", default=",".join(utils.available_codecs()),
+                        help="comma-separated codec names")
+    parser.add_argument("--source", default="test:gradient",
+                        help="camera source: test:<gradient|noise|static>, a video file or an image sequence")
+    parser.add_argument("--sizes", default="640x480", help="comma-separated WIDTHxHEIGHT")
+    parser.add_argument("--qualities", default="60", help="comma-separated JPEG-style qualities")
+    parser.add_argument("--fps", default="15", help="comma-separated frame rates (call suite)")
+    parser.add_argument("--peers", default="1,2,4", help="comma-separated client counts (call suite)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per call scenario")
+    parser.add_argument("--frames", type=int, default=100, help="frames per codec scenario")
+    parser.add_argument("--output", help="append results as JSON lines")
+    parser.add_argument("--baseline", help="JSON lines from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    codecs = [c for c in args.codecs.split(",") if c]
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+    qualities = [int(q) for q in args.qualities.split(",")]
+    frame_rates = [int(f) for f in args.fps.split(",")]
+    peer_counts = [int(p) for p in args.peers.split(",")]
+
+    results = []
+    if args.suite in ("codec", "all"):
+        for codec in codecs:
+            for width, height in sizes:
+                for quality in qualities:
+                    results.append(bench_codec(codec, width, height, quality, args.frames, args.source))
+                    report(results[-1])
+    if args.suite in ("call", "all"):
+        for codec in codecs:
+            for width, height in sizes:
+                for quality in qualities:
+                    for fps in frame_rates:
+                        for peers in peer_counts:
+                            results.append(bench_call(peers, codec, width, height, quality, fps,
+                                                      args.duration, source=args.source))
+                            report(results[-1])
+
+    if args.output:
+        for result in results:
+            metrics.append_json_line(args.output, result)
+    if args.baseline:
+        regressions = check_regressions(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
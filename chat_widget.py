@@ -1,7 +1,190 @@
-from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, 
-                             QPushButton, QLineEdit, QScrollArea, QLabel, QFrame)
-from PyQt6.QtCore import Qt, pyqtSignal, QTimer
-from PyQt6.QtGui import QColor, QPalette
+import collections
+import json
+import tempfile
+import time
+
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QListView, QStyledItemDelegate,
+                             QPushButton, QLineEdit, QLabel, QFrame, QListWidget)
+from PyQt6.QtCore import Qt, pyqtSignal, QTimer, QAbstractListModel, QModelIndex, QSize, QRect
+from PyQt6.QtGui import QColor, QFont, QFontMetrics, QStaticText, QTransform
+
+# Messages kept in memory; older ones are spilled to a temp file and read back on demand
+MAX_RETAINED_MESSAGES = 2000
+# Messages read back per "load older" step (scrolling to the top)
+HISTORY_CHUNK = 200
+# Prepared text layouts kept by the delegate
+LAYOUT_CACHE_SIZE = 4096
+# Transcript search runs once typing pauses this long (ms)
+SEARCH_DELAY_MS = 150
+
+ChatMessage = collections.namedtuple("ChatMessage", "id text is_me")
+
+class ChatModel(QAbstractListModel):
+    """
+    The chat history. Rows are the most recent messages; once more than
+    max_retained are held, the oldest are written to a spill file (once) and
+    dropped from memory. load_older() brings them back a chunk at a time.
+    """
+    MessageRole = Qt.ItemDataRole.UserRole
+
+    def __init__(self, max_retained=MAX_RETAINED_MESSAGES):
+        super().__init__()
+        self.max_retained = max_retained
+        self.messages = collections.deque()
+        self.total = 0
+        # Global id of the first row in memory
+        self.first_id = 0
+        # Messages [0, len(spill_offsets)) are on disk, one JSON line each
+        self.spill = None
+        self.spill_offsets = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.messages)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        message = self.messages[index.row()]
+        if role == self.MessageRole:
+            return message
+        if role == Qt.ItemDataRole.DisplayRole:
+            return message.text
+        return None
+
+    def append(self, texts, is_me=False):
+        """
+        Adds messages at the end with a single row insertion.
+        """
+        if not texts:
+            return
+        row = len(self.messages)
+        self.beginInsertRows(QModelIndex(), row, row + len(texts) - 1)
+        for text in texts:
+            self.messages.append(ChatMessage(self.total, text, is_me))
+            self.total += 1
+        self.endInsertRows()
+
+    def trim(self):
+        """
+        Drops the oldest rows beyond max_retained, spilling any not yet on disk.
+        """
+        excess = len(self.messages) - self.max_retained
+        if excess <= 0:
+            return
+        self.beginRemoveRows(QModelIndex(), 0, excess - 1)
+        for _ in range(excess):
+            message = self.messages.popleft()
+            if message.id == len(self.spill_offsets):
+                self._spill(message)
+            self.first_id += 1
+        self.endRemoveRows()
+
+    def _spill(self, message):
+        if self.spill is None:
+            self.spill = tempfile.TemporaryFile()
+        self.spill.seek(0, 2)
+        self.spill_offsets.append(self.spill.tell())
+        self.spill.write(json.dumps([message.text, message.is_me]).encode("utf-8") + b"\n")
+
+    def has_older(self):
+        return self.first_id > 0
+
+    def load_older(self, count=HISTORY_CHUNK):
+        """
+        Reads up to count spilled messages back in front of the first row.
+        Returns how many rows were added.
+        """
+        start = max(0, self.first_id - count)
+        if start == self.first_id:
+            return 0
+        self.spill.seek(self.spill_offsets[start])
+        older = []
+        for message_id in range(start, self.first_id):
+            text, is_me = json.loads(self.spill.readline())
+            older.append(ChatMessage(message_id, text, is_me))
+        self.beginInsertRows(QModelIndex(), 0, len(older) - 1)
+        self.messages.extendleft(reversed(older))
+        self.first_id = start
+        self.endInsertRows()
+        return len(older)
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+
+
+class ChatDelegate(QStyledItemDelegate):
+    """
+    Paints chat bubbles straight onto the list's viewport: only visible rows are
+    ever painted, and each message's wrapped text layout (a QStaticText) is
+    prepared once per view width and cached.
+    """
+    MAX_BUBBLE_WIDTH = 240
+    PADDING_X = 15
+    PADDING_Y = 10
+    RADIUS = 18
+    SPACING = 15
+    MARGIN = 15
+
+    def __init__(self, view):
+        super().__init__(view)
+        self.view = view
+        self.font = QFont(view.font())
+        self.font.setPixelSize(14)
+        self.metrics = QFontMetrics(self.font)
+        self.layouts = collections.OrderedDict() # (message id, text width) -> QStaticText
+
+    def _max_text_width(self):
+        available = self.view.viewport().width() - 2 * self.MARGIN
+        return max(20, min(self.MAX_BUBBLE_WIDTH, available) - 2 * self.PADDING_X)
+
+    def _layout(self, message):
+        max_width = self._max_text_width()
+        key = (message.id, max_width)
+        text = self.layouts.get(key)
+        if text is not None:
+            self.layouts.move_to_end(key)
+            return text
+        natural = max(self.metrics.horizontalAdvance(line) for line in message.text.split("\n"))
+        text = QStaticText(message.text)
+        text.setTextFormat(Qt.TextFormat.PlainText)
+        text.setTextWidth(min(natural + 1, max_width))
+        text.prepare(QTransform(), self.font)
+        self.layouts[key] = text
+        if len(self.layouts) > LAYOUT_CACHE_SIZE:
+            self.layouts.popitem(last=False)
+        return text
+
+    def sizeHint(self, option, index):
+        text = self._layout(index.data(ChatModel.MessageRole))
+        height = int(text.size().height()) + 2 * self.PADDING_Y + self.SPACING
+        return QSize(self.view.viewport().width(), height)
+
+    def paint(self, painter, option, index):
+        message = index.data(ChatModel.MessageRole)
+        text = self._layout(message)
+        size = text.size()
+        width = int(size.width()) + 2 * self.PADDING_X
+        height = int(size.height()) + 2 * self.PADDING_Y
+        rect = option.rect
+        if message.is_me:
+            bubble = QRect(rect.right() - self.MARGIN - width, rect.top(), width, height)
+            background, foreground = QColor("#8ab4f8"), QColor("#202124")
+        else:
+            bubble = QRect(rect.left() + self.MARGIN, rect.top(), width, height)
+            background, foreground = QColor("#3c4043"), QColor("white")
+
+        painter.save()
+        painter.setRenderHint(painter.RenderHint.Antialiasing)
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(background)
+        painter.drawRoundedRect(bubble, self.RADIUS, self.RADIUS)
+        painter.setPen(foreground)
+        painter.setFont(self.font)
+        painter.drawStaticText(bubble.left() + self.PADDING_X, bubble.top() + self.PADDING_Y, text)
+        painter.restore()
+
 
 class ChatWidget(QWidget):
     message_sent = pyqtSignal(str)
@@ -9,6 +192,8 @@ class ChatWidget(QWidget):
     def __init__(self):
         super().__init__()
         self.setFixedWidth(320)
+        # TranscriptStore searched from the search box; set by the call
+        self.transcript = None
         self.init_ui()
 
     def init_ui(self):
@@ -35,11 +220,59 @@ class ChatWidget(QWidget):
         
         layout.addWidget(header)
 
-        # Messages Area
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.scroll_area.setStyleSheet("""
-            QScrollArea { border: none; background-color: #202124; }
+        # Search across past meetings' transcripts; results replace the message list while there's a query
+        search_area = QFrame()
+        search_area.setStyleSheet("background-color: #202124;")
+        search_layout = QHBoxLayout(search_area)
+        search_layout.setContentsMargins(15, 10, 15, 0)
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search past meetings...")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.setStyleSheet("""
+            QLineEdit {
+                background-color: #303134;
+                border-radius: 15px;
+                padding: 6px 12px;
+                color: white;
+                border: none;
+                font-size: 13px;
+            }
+        """)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_input.textChanged.connect(self.search_timer.start)
+        search_layout.addWidget(self.search_input)
+        search_area.hide()
+        self.search_area = search_area
+        layout.addWidget(search_area)
+
+        self.search_results = QListWidget()
+        self.search_results.setWordWrap(True)
+        self.search_results.setSelectionMode(QListWidget.SelectionMode.NoSelection)
+        self.search_results.setFocusPolicy(Qt.FocusPolicy.NoFocus)
+        self.search_results.setStyleSheet("""
+            QListWidget { border: none; background-color: #202124; color: #e8eaed; padding: 10px; }
+            QListWidget::item { padding: 6px 0; border-bottom: 1px solid #3c4043; }
+        """)
+        self.search_results.hide()
+        layout.addWidget(self.search_results)
+
+        # Messages Area: a model/view list, so only visible bubbles exist as pixels
+        self.model = ChatModel()
+        self.message_list = QListView()
+        self.message_list.setModel(self.model)
+        self.message_list.setItemDelegate(ChatDelegate(self.message_list))
+        self.message_list.setSelectionMode(QListView.SelectionMode.NoSelection)
+        self.message_list.setFocusPolicy(Qt.FocusPolicy.NoFocus)
+        self.message_list.setVerticalScrollMode(QListView.ScrollMode.ScrollPerPixel)
+        self.message_list.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        # Re-lay out rows when the panel width changes (bubbles rewrap)
+        self.message_list.setResizeMode(QListView.ResizeMode.Adjust)
+        self.message_list.setViewportMargins(0, 15, 0, 0)
+        self.message_list.setStyleSheet("""
+            QListView { border: none; background-color: #202124; }
             QScrollBar:vertical {
                 border: none;
                 background: #202124;
@@ -53,15 +286,12 @@ class ChatWidget(QWidget):
             }
         """)
         
-        self.messages_container = QWidget()
-        self.messages_container.setStyleSheet("background-color: #202124;")
-        self.messages_layout = QVBoxLayout(self.messages_container)
-        self.messages_layout.setAlignment(Qt.AlignmentFlag.AlignTop)
-        self.messages_layout.setSpacing(15)
-        self.messages_layout.setContentsMargins(15, 15, 15, 15)
-        
-        self.scroll_area.setWidget(self.messages_container)
-        layout.addWidget(self.scroll_area)
+        scrollbar = self.message_list.verticalScrollBar()
+        scrollbar.valueChanged.connect(self.on_scrolled)
+        # Follow new messages only while the user is at the bottom
+        self.follow = True
+        self._scroll_pending = False
+        layout.addWidget(self.message_list)
 
         # Input Area
         input_area = QFrame()
@@ -117,39 +347,59 @@ class ChatWidget(QWidget):
             self.msg_input.clear()
 
     def add_message(self, text, is_me=False):
-        bubble_container = QHBoxLayout()
-        bubble_container.setContentsMargins(0, 0, 0, 0)
-        
-        bubble = QLabel(text)
-        bubble.setWordWrap(True)
-        # Max width 80% of container
-        bubble.setMaximumWidth(240) 
-        
+        self.add_messages([text], is_me)
+
+    def add_messages(self, texts, is_me=False):
+        """
+        Adds a batch of messages in one model update.
+        """
+        self.model.append(texts, is_me)
+        if len(self.model.messages) > 2 * self.model.max_retained:
+            # Even while the user reads back, memory stays bounded
+            self.model.trim()
         if is_me:
-            bubble_container.setAlignment(Qt.AlignmentFlag.AlignRight)
-            bg_color = "#8ab4f8"
-            text_color = "#202124"
-        else:
-            bubble_container.setAlignment(Qt.AlignmentFlag.AlignLeft)
-            bg_color = "#3c4043"
-            text_color = "white"
-
-        bubble.setStyleSheet(f"""
-            QLabel {{
-                background-color: {bg_color};
-                color: {text_color};
-                padding: 10px 15px;
-                border-radius: 18px;
-                font-size: 14px;
-            }}
-        """)
-        
-        bubble_container.addWidget(bubble)
-        self.messages_layout.addLayout(bubble_container)
-        
-        # Auto scroll to bottom
-        QTimer.singleShot(10, self.scroll_to_bottom)
+            self.follow = True
+        if self.follow and not self._scroll_pending:
+            # One scroll (and trim) per event-loop pass, however many messages arrive
+            self._scroll_pending = True
+            QTimer.singleShot(0, self.scroll_to_bottom)
+
+    def set_transcript(self, transcript):
+        """
+        Enables the search box, over transcript's past meetings.
+        """
+        self.transcript = transcript
+        self.search_area.setVisible(transcript is not None)
+
+    def run_search(self):
+        query = self.search_input.text().strip()
+        searching = bool(query) and self.transcript is not None
+        self.search_results.setVisible(searching)
+        self.message_list.setVisible(not searching)
+        self.search_results.clear()
+        if not searching:
+            return
+        results = self.transcript.search(query)
+        if not results:
+            self.search_results.addItem("No matching messages")
+            return
+        for result in results:
+            started = time.strftime("%Y-%m-%d %H:%M", time.localtime(result.meeting_started))
+            who = "You" if result.is_me else "Them"
+            self.search_results.addItem(f"{started}  {result.meeting_title}\n{who}: {result.snippet}")
 
     def scroll_to_bottom(self):
-        scrollbar = self.scroll_area.verticalScrollBar()
-        scrollbar.setValue(scrollbar.maximum())
+        self._scroll_pending = False
+        # Only trim while following, so history the user scrolled back to stays put
+        self.model.trim()
+        self.message_list.scrollToBottom()
+
+    def on_scrolled(self, value):
+        scrollbar = self.message_list.verticalScrollBar()
+        self.follow = value >= scrollbar.maximum() - 5
+        if value == scrollbar.minimum() and self.model.has_older():
+            # Reached the top: bring back spilled history, keeping the view where it was
+            old_max = scrollbar.maximum()
+            if self.model.load_older():
+                self.message_list.doItemsLayout()
+                scrollbar.setValue(scrollbar.maximum() - old_max)
@@ -0,0 +1,112 @@
+"""
+Concurrency check for multi-party calls: a host and N ConnectionManager clients on
+a free localhost port, all in this process, each sending a test-pattern stream.
+
+Checks that
+- every participant receives every other participant's video stream,
+- chat from each participant is fanned out to everyone else,
+- a client that leaves produces participant_left on everyone still in the call.
+
+Examples:
+    python concurrency_check.py                 # 8 clients
+    python concurrency_check.py --peers 16 --codec h264
+
+Exits 1 if any check fails.
+"""
+import argparse
+import sys
+
+from PyQt6.QtCore import QCoreApplication
+
+import network
+import video
+from benchmark import free_port, pump
+
+# Small, slow streams: the check is about fan-out, not throughput
+WIDTH, HEIGHT, FPS = 320, 240, 10
+
+class Participant:
+    """
+    One ConnectionManager plus what it has received.
+    """
+    def __init__(self, name, codec):
+        self.name = name
+        self.manager = network.ConnectionManager(fps=FPS, codecs=[codec])
+        self.camera = video.VideoCamera("test:gradient", WIDTH, HEIGHT, FPS)
+        self.manager.set_camera(self.camera)
+        self.streams = set()
+        self.chat = []
+        self.left = []
+        self.manager.new_frame_received.connect(lambda frame: self.streams.add(frame.stream_id))
+        self.manager.chat_messages_received.connect(self.chat.extend)
+        self.manager.participant_left.connect(self.left.append)
+
+    @property
+    def stream_id(self):
+        return self.manager.peer_id
+
+    def stop(self):
+        self.manager.stop_connection()
+        self.camera.release()
+
+def run(peers, codec, timeout):
+    app = QCoreApplication.instance() or QCoreApplication([])
+    port = free_port()
+    host = Participant("host", codec)
+    clients = [Participant(f"client {i + 1}", codec) for i in range(peers)]
+    everyone = [host] + clients
+    failures = []
+
+    def check(name, condition):
+        passed = pump(app, timeout, until=condition)
+        print(f"{'PASS' if passed else 'FAIL'}  {name}")
+        if not passed:
+            failures.append(name)
+        return passed
+
+    host.manager.start_host(port)
+    pump(app, 0.3)
+    for client in clients:
+        client.manager.start_client(f"ws://127.0.0.1:{port}")
+    try:
+        if not check(f"{peers} clients connected", lambda: len(host.manager.peers) == peers):
+            return failures
+
+        ids = {participant.stream_id for participant in everyone}
+        check("every participant receives every other stream",
+              lambda: all(p.streams >= ids - {p.stream_id} for p in everyone))
+        missing = {p.name: sorted(ids - {p.stream_id} - p.streams) for p in everyone
+                   if not p.streams >= ids - {p.stream_id}}
+        if missing:
+            print(f"      missing streams: {missing}")
+
+        for participant in everyone:
+            participant.manager.send_chat_message(f"hello from {participant.name}")
+        def chat_fanned_out():
+            return all(sorted(p.chat) == sorted(f"hello from {other.name}" for other in everyone if other is not p)
+                       for p in everyone)
+        check("chat reaches everyone else exactly once", chat_fanned_out)
+
+        leaving = clients[-1]
+        leaving.stop()
+        staying = everyone[:-1]
+        check(f"{leaving.name} leaving is seen by everyone",
+              lambda: all(leaving.stream_id in p.left for p in staying)
+              and len(host.manager.peers) == peers - 1)
+    finally:
+        for participant in everyone:
+            participant.stop()
+        pump(app, 0.3)
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-client call concurrency check on localhost")
+    parser.add_argument("--peers", type=int, default=8, help="number of clients")
+    parser.add_argument("--codec", default="jpeg")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds allowed per check")
+    args = parser.parse_args(argv)
+    failures = run(args.peers, args.codec, args.timeout)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Congestion check for adaptive quality: a host sends a heavy test pattern to one
+client on localhost whose socket is only read in short bursts, so the host's
+write buffer backs up. Drain-time congestion is switched off on the host's link,
+so the only way its QualityController can step down is through the write-buffer
+measurement.
+
+Examples:
+    python congestion_check.py
+    python congestion_check.py --timeout 30
+
+Exits 1 if the host never steps down.
+"""
+import argparse
+import socket
+import sys
+
+from PyQt6.QtCore import QCoreApplication
+
+import network
+import video
+from benchmark import free_port, pump
+
+WIDTH, HEIGHT, FPS = 640, 480, 15
+# Kernel socket buffers, kept small so the backlog shows up in the transport buffer
+SOCKET_BUFFER = 16 * 1024
+# The client reads for READ_TIME out of every READ_PERIOD seconds
+READ_TIME = 0.01
+READ_PERIOD = 0.5
+
+def throttle_reading(loop, transport, stop):
+    """
+    Pauses transport's reading, letting it read only READ_TIME in every READ_PERIOD, until stop().
+    """
+    def pause():
+        if stop():
+            return
+        transport.pause_reading()
+        loop.call_later(READ_PERIOD - READ_TIME, resume)
+
+    def resume():
+        transport.resume_reading()
+        loop.call_later(READ_TIME, pause)
+
+    loop.call_soon_threadsafe(pause)
+
+def shrink_buffers(transport, option):
+    sock = transport.get_extra_info("socket")
+    if sock is not None:
+        sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER)
+
+def run(codec, timeout):
+    app = QCoreApplication.instance() or QCoreApplication([])
+    port = free_port()
+    managers = [network.ConnectionManager(fps=FPS, codecs=[codec]) for _ in range(2)]
+    host, client = managers
+    cameras = []
+    for manager in managers:
+        camera = video.VideoCamera("test:noise", WIDTH, HEIGHT, FPS)
+        manager.set_camera(camera)
+        cameras.append(camera)
+    stopped = [False]
+    passed = False
+
+    host.start_host(port)
+    pump(app, 0.3)
+    client.start_client(f"ws://127.0.0.1:{port}")
+    try:
+        if not pump(app, timeout, until=lambda: len(host.peers) == 1 and 0 in client.peers):
+            print("FAIL  client connected")
+            return False
+        peer = next(iter(host.peers.values()))
+        start = peer.quality.rung
+        # Only the write buffer may report congestion on this link
+        peer.quality.DRAIN_HIGH = float("inf")
+        shrink_buffers(peer.websocket.transport, socket.SO_SNDBUF)
+        client_transport = client.peers[0].websocket.transport
+        shrink_buffers(client_transport, socket.SO_RCVBUF)
+        throttle_reading(client.loop, client_transport, lambda: stopped[0])
+
+        passed = pump(app, timeout, until=lambda: peer.quality.rung < start)
+        print(f"{'PASS' if passed else 'FAIL'}  write buffer backlog steps the host down "
+              f"(rung {start} -> {peer.quality.rung}, last sample {peer.quality.buffered} bytes, "
+              f"high-water mark {peer.quality.buffer_high})")
+        profile = host.get_stats()["profile"]
+        encoder_followed = profile == host.quality_ladder[peer.quality.rung]._asdict()
+        print(f"{'PASS' if encoder_followed else 'FAIL'}  encoder uses the congested link's rung")
+        passed = passed and encoder_followed
+    finally:
+        stopped[0] = True
+        for manager in managers:
+            manager.stop_connection()
+        for camera in cameras:
+            camera.release()
+        pump(app, 0.3)
+    return passed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write-buffer congestion check on localhost")
+    parser.add_argument("--codec", default="jpeg")
+    parser.add_argument("--timeout", type=float, default=20.0, help="seconds allowed per check")
+    args = parser.parse_args(argv)
+    return 0 if run(args.codec, args.timeout) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
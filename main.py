@@ -1,8 +1,10 @@
+import os
 import sys
-from PyQt6.QtWidgets import QApplication, QMainWindow, QStackedWidget
+from PyQt6.QtWidgets import QApplication, QMainWindow, QStackedWidget, QFileDialog, QMessageBox
 from login_widget import LoginWidget
 from selection_widget import ModeSelectionWidget
 from ui import VideoCallWidget
+import recording
 
 class MainAppWindow(QMainWindow):
     def __init__(self):
@@ -47,7 +49,19 @@ class MainAppWindow(QMainWindow):
         self.stack.setCurrentWidget(self.selection_widget)
 
     def go_to_video(self, mode):
-        self.video_widget = VideoCallWidget(mode=mode)
+        if mode == "PLAYBACK":
+            directory = os.environ.get("VIRN_RECORDINGS_DIR") or recording.DEFAULT_DIR
+            path, _ = QFileDialog.getOpenFileName(self, "Watch a recording", directory,
+                                                  f"Recordings (*{recording.RECORDING_EXTENSION})")
+            if not path:
+                return
+            try:
+                self.video_widget = VideoCallWidget(mode=mode, recording=path)
+            except (OSError, ValueError) as e:
+                QMessageBox.warning(self, "Recording", f"Could not open {path}: {e}")
+                return
+        else:
+            self.video_widget = VideoCallWidget(mode=mode)
         self.video_widget.call_ended.connect(self.go_back_to_selection)
         
         self.stack.addWidget(self.video_widget) 
@@ -0,0 +1,106 @@
+import bisect
+import collections
+import json
+import threading
+import time
+
+# Pipeline stages we time, in the order a frame goes through them.
+# "capture" is frame age when encoding starts, "transit" is capture -> receive on the
+# peer (wall clocks, so it relies on both machines being NTP-synced; rtt_ms does not).
+# "av_skew" isn't a stage but is summarised the same way: video minus audio capture time
+# at the moment a frame is rendered (positive = picture ahead of sound).
+STAGES = ["capture", "encode", "send", "transit", "decode", "render", "end_to_end", "av_skew"]
+
+# Upper bounds (bytes, exclusive) of the encoded-size histogram buckets; the last bucket is open-ended
+SIZE_BUCKETS = [1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072]
+
+class CallMetrics:
+    """
+    Latency and throughput counters for one ConnectionManager.
+    Written from the asyncio thread, the codec workers and the GUI thread,
+    so every update goes through one lock. Timings are kept in milliseconds.
+    """
+    def __init__(self, window=120):
+        self.lock = threading.Lock()
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.timings = {stage: collections.deque(maxlen=self.window) for stage in STAGES}
+            self.counters = collections.Counter()
+            self.size_histogram = [0] * (len(SIZE_BUCKETS) + 1)
+            self.rtt = None
+            self.started = time.monotonic()
+            self._last_snapshot = (self.started, collections.Counter())
+
+    def record(self, stage, milliseconds):
+        with self.lock:
+            self.timings[stage].append(milliseconds)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def frame_sent(self, size):
+        with self.lock:
+            self.counters["frames_out"] += 1
+            self.counters["bytes_out"] += size
+            self.size_histogram[bisect.bisect_right(SIZE_BUCKETS, size)] += 1
+
+    def frame_received(self, size):
+        with self.lock:
+            self.counters["frames_in"] += 1
+            self.counters["bytes_in"] += size
+
+    def set_rtt(self, milliseconds):
+        with self.lock:
+            self.rtt = milliseconds
+
+    def snapshot(self):
+        """
+        Returns a JSON-serialisable dict. Rates cover the time since the previous snapshot.
+        """
+        with self.lock:
+            now = time.monotonic()
+            last_time, last_counters = self._last_snapshot
+            elapsed = max(now - last_time, 1e-6)
+            counters = collections.Counter(self.counters)
+            self._last_snapshot = (now, counters)
+
+            stats = {
+                "time": time.time(),
+                "fps_out": (counters["frames_out"] - last_counters["frames_out"]) / elapsed,
+                "fps_in": (counters["frames_in"] - last_counters["frames_in"]) / elapsed,
+                "kbps_out": (counters["bytes_out"] - last_counters["bytes_out"]) * 8 / 1000 / elapsed,
+                "kbps_in": (counters["bytes_in"] - last_counters["bytes_in"]) * 8 / 1000 / elapsed,
+                "rtt_ms": self.rtt,
+                "counters": dict(counters),
+                "encoded_size_histogram": dict(zip(
+                    [f"<{b // 1024}KB" for b in SIZE_BUCKETS] + [f">={SIZE_BUCKETS[-1] // 1024}KB"],
+                    self.size_histogram)),
+            }
+            for stage, samples in self.timings.items():
+                stats[f"{stage}_ms"] = summarize(samples)
+            return stats
+
+def summarize(samples):
+    """
+    Mean / p50 / p95 / max of a window of timings, or None if empty.
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return {
+        "mean": sum(ordered) / len(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+def append_json_line(path, stats):
+    """
+    Appends one snapshot as a JSON line, the format our log collectors ingest.
+    """
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(stats) + "\n")
@@ -1,39 +1,471 @@
 import asyncio
+import collections
+import os
 import threading
 import websockets
-import cv2
 import time
+from concurrent.futures import ThreadPoolExecutor
 from PyQt6.QtCore import QObject, pyqtSignal
-from PyQt6.QtGui import QImage
+import audio
+import metrics
+import protocol
+import recording
 import utils
+import video
+
+# Encoded frames per stream waiting for a peer's socket. Kept tiny: a stale frame is worth less than a fresh one.
+SEND_QUEUE_SIZE = 2
+AUDIO_QUEUE_SIZE = 10
+DEFAULT_FPS = 15
+
+# Outbound lanes, highest priority first
+LANE_CONTROL, LANE_CHAT, LANE_AUDIO, LANE_VIDEO = range(4)
+HANDSHAKE_TIMEOUT = 5.0
+KEYFRAME_REQUEST_INTERVAL = 1.0
+STATS_INTERVAL = 1.0
+
+# Received messages kept in a recording (outgoing video, audio and chat are recorded where they're packed)
+RECORDED_TYPES = (protocol.VIDEO, protocol.AUDIO, protocol.CHAT)
+
+# Chat sent or received within this window (seconds) travels / reaches the UI as one batch
+CHAT_BATCH_WINDOW = 0.02
+# Upper bound on one batched chat message, so a huge paste can't stall the chat lane
+MAX_CHAT_BATCH_BYTES = 64 * 1024
+
+# Video playout: frames this far (seconds) behind their clock are dropped if a newer one is
+# coming, early frames are held at most MAX_VIDEO_HOLD. Without audio, frames are delayed
+# to the PLAYOUT_PERCENTILE of recent transit times.
+VIDEO_LATE_THRESHOLD = 0.04
+MAX_VIDEO_HOLD = 0.5
+PLAYOUT_WINDOW = 90
+PLAYOUT_PERCENTILE = 0.9
+
+QualityProfile = collections.namedtuple("QualityProfile", "width height quality fps")
+
+# Rungs the adaptive controller moves between, worst to best
+QUALITY_LADDER = [
+    QualityProfile(320, 240, 40, 8),
+    QualityProfile(320, 240, 50, 12),
+    QualityProfile(480, 360, 55, 15),
+    QualityProfile(640, 480, 60, 15),
+    QualityProfile(640, 480, 70, 30),
+]
+DEFAULT_RUNG = 3
+
+class QualityController:
+    """
+    Picks a rung of QUALITY_LADDER from one peer link's send backpressure.
+    Steps down quickly when sends take a large share of the frame interval or
+    the socket's write buffer builds up, and steps back up only after a sustained
+    quiet period, so latency stays bounded instead of piling up in the buffer.
+    """
+    # A send is "slow" when draining takes more than this share of the frame interval
+    DRAIN_HIGH = 0.5
+    DRAIN_LOW = 0.1
+    # Write buffer (bytes) counts as backed up above the link's high-water mark and as
+    # empty below its low-water mark. These defaults are websockets' write_limit and the
+    # low mark asyncio derives from it; set_buffer_limits() uses the link's actual marks.
+    BUFFER_HIGH = 32 * 1024
+    BUFFER_LOW = 8 * 1024
+    DOWN_HOLD = 1.0
+    UP_HOLD = 5.0
+
+    def __init__(self, ladder=QUALITY_LADDER, start=DEFAULT_RUNG):
+        self.ladder = ladder
+        self.start = start
+        self.buffer_high = self.BUFFER_HIGH
+        self.buffer_low = self.BUFFER_LOW
+        self.reset()
+
+    def reset(self):
+        self.rung = self.start
+        self.drain_avg = 0.0
+        self.buffered = 0
+        self.last_change = time.monotonic()
+
+    @property
+    def profile(self):
+        return self.ladder[self.rung]
+
+    def set_buffer_limits(self, low, high):
+        """
+        Judges the write buffer against the link's own flow-control marks. send()
+        doesn't return until the buffer is back under them, so any fixed threshold
+        above the high mark would never be reached.
+        """
+        self.buffer_low = low
+        self.buffer_high = high
+
+    def record_send(self, drain_time, buffered_bytes):
+        """
+        Feeds one send measurement: how long send() took, and the bytes in the write
+        buffer once the message was queued (before send() waited for it to drain).
+        Returns True if the profile changed.
+        """
+        self.drain_avg = 0.8 * self.drain_avg + 0.2 * drain_time
+        self.buffered = buffered_bytes
+        interval = 1.0 / self.profile.fps
+        since_change = time.monotonic() - self.last_change
+
+        congested = self.drain_avg > self.DRAIN_HIGH * interval or buffered_bytes > self.buffer_high
+        idle = self.drain_avg < self.DRAIN_LOW * interval and buffered_bytes < self.buffer_low
+
+        if congested and self.rung > 0 and since_change > self.DOWN_HOLD:
+            return self._step(-1)
+        if idle and self.rung < len(self.ladder) - 1 and since_change > self.UP_HOLD:
+            return self._step(1)
+        return False
+
+    def _step(self, direction):
+        self.rung += direction
+        self.last_change = time.monotonic()
+        # Measurements taken at the old rung say little about the new one
+        self.drain_avg = 0.0
+        return True
+
+class Peer:
+    """
+    One websocket link with its own outbound scheduler. Messages wait in priority
+    lanes (control > chat > audio > video) and the peer's sender task always sends
+    from the highest non-empty lane, so on a congested link text and control never
+    queue behind seconds of video.
+
+    Control and chat lanes are unbounded FIFOs: nothing is dropped and order is kept.
+    Audio and video are bounded and drop their oldest entry when full; video has one
+    small queue per stream, drained round-robin, so a slow peer only ever loses its
+    own frames and one busy stream can't crowd out the others.
+    """
+    def __init__(self, peer_id, websocket, quality=None):
+        self.peer_id = peer_id
+        self.websocket = websocket
+        # This link's own congestion state, fed by the sender with our video's sends
+        self.quality = quality or QualityController()
+        limits = write_buffer_limits(websocket)
+        if limits is not None:
+            self.quality.set_buffer_limits(*limits)
+        self.control = collections.deque()
+        self.chat = collections.deque()
+        self.audio = collections.deque()
+        self.video = collections.OrderedDict() # stream id -> deque of encoded messages
+        self.ready = asyncio.Event()
+        self.sender_task = None
+        # False for peers that can't decode the call's audio codec (video-only)
+        self.receives_audio = True
+
+    def send_control(self, message):
+        self.control.append(message)
+        self.ready.set()
+
+    def send_chat(self, message):
+        self.chat.append(message)
+        self.ready.set()
+
+    def queue_audio(self, message):
+        """
+        Queues an audio packet; returns True if an older one was dropped.
+        """
+        if not self.receives_audio:
+            return False
+        dropped = len(self.audio) >= AUDIO_QUEUE_SIZE
+        if dropped:
+            self.audio.popleft()
+        self.audio.append(message)
+        self.ready.set()
+        return dropped
+
+    def queue_video(self, stream_id, message):
+        """
+        Queues an encoded video message; returns True if an older one was dropped.
+        """
+        queue = self.video.setdefault(stream_id, collections.deque())
+        dropped = len(queue) >= SEND_QUEUE_SIZE
+        if dropped:
+            queue.popleft()
+        queue.append(message)
+        self.ready.set()
+        return dropped
+
+    async def next_message(self):
+        """
+        Waits for the next message to send. Returns (lane, message).
+        """
+        while True:
+            for lane, queue in ((LANE_CONTROL, self.control), (LANE_CHAT, self.chat), (LANE_AUDIO, self.audio)):
+                if queue:
+                    return lane, queue.popleft()
+            for stream_id, queue in self.video.items():
+                if queue:
+                    self.video.move_to_end(stream_id)
+                    return LANE_VIDEO, queue.popleft()
+            self.ready.clear()
+            await self.ready.wait()
+
+    def drop_stream(self, stream_id):
+        self.video.pop(stream_id, None)
+
+class PlayoutClock:
+    """
+    Decides when one stream's decoded frames are due on screen. While the stream's
+    audio is playing, frames follow the audio clock, i.e. the capture time of the
+    sound being heard (lip sync). Otherwise they follow the wall clock, at a delay
+    that covers most of the recently measured transit jitter.
+    """
+    def __init__(self, window=PLAYOUT_WINDOW):
+        self.transits = collections.deque(maxlen=window)
+
+    def delay(self, timestamp, audio_now=None):
+        """
+        Seconds until a frame captured at timestamp (wall clock, us) is due:
+        positive means early (hold it), negative means late.
+        """
+        if audio_now is not None:
+            return (timestamp - audio_now) / 1_000_000
+        transit = (protocol.wall_time_us() - timestamp) / 1_000_000
+        self.transits.append(transit)
+        ordered = sorted(self.transits)
+        return ordered[int(len(ordered) * PLAYOUT_PERCENTILE)] - transit
+
+class RemoteStream:
+    """
+    Receive-side state for one participant's video: its decoder and the
+    messages waiting to be decoded.
+    """
+    def __init__(self, stream_id, codec, view_size=None):
+        self.stream_id = stream_id
+        self.codec = codec
+        self.pending = []
+        self.last_seq = None
+        # Nothing is decodable until the first keyframe (we may join mid-stream)
+        self.waiting_for_keyframe = True
+        self.last_keyframe_request = 0.0
+        # Size the UI shows this stream at (None = unknown, (0, 0) = not shown at all)
+        self.view_size = view_size
+        # Full resolution of the stream, learnt from the last decoded frame
+        self.frame_size = None
+        self.playout = PlayoutClock()
+        # Capture time of the newest frame handed to the UI
+        self.presented_ts = 0
+
+    @property
+    def paused(self):
+        return self.view_size == (0, 0)
 
 class ConnectionManager(QObject):
     """
-    Manages the P2P connection using WebSockets.
+    Manages the call's WebSocket connections.
     Runs an asyncio loop in a separate thread.
+
+    The host is a selective forwarding unit: it keeps a registry of peers and
+    forwards each participant's already-encoded frames and chat to everyone
+    else, while also taking part in the call itself. Clients keep a single
+    link to the host and receive every other participant's stream over it.
     """
     connected = pyqtSignal()
     disconnected = pyqtSignal()
     error = pyqtSignal(str)
-    chat_message_received = pyqtSignal(str)
-    new_frame_received = pyqtSignal(QImage)
+    chat_messages_received = pyqtSignal(list) # texts, oldest first
+    stats_updated = pyqtSignal(dict)
+    new_frame_received = pyqtSignal(object) # video.VideoFrame
+    participant_joined = pyqtSignal(int) # stream id
+    participant_left = pyqtSignal(int) # stream id
+    participant_video_muted = pyqtSignal(int, bool) # stream id, camera off
 
-    def __init__(self):
+    def __init__(self, fps=DEFAULT_FPS, codecs=None, metrics_log=None):
         super().__init__()
         self.loop = None
         self.thread = None
         self.running = False
         self.video_camera = None
-        self.websocket = None
+        self.is_host = False
+        # Our own stream id: 0 for the host, assigned by the host for clients
+        self.peer_id = 0
+        # Open links by peer id (clients have just one: the host, id 0)
+        self.peers = {}
+        self._next_peer_id = 1
+        self._stop_event = None
+        # Encode workers; threads are spawned lazily on first use
+        self.encode_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="encode")
+        self.frames_dropped = 0
+        self.target_fps = fps
+        self.pacer = utils.FramePacer(fps)
+        # Every peer link gets its own QualityController on this ladder; the shared
+        # encoder follows the most congested one (see _quality_profile)
+        self.quality_ladder = QUALITY_LADDER
+        self.quality_start = DEFAULT_RUNG
+        # Codecs we offer, in preference order. Everybody in a call uses the same one,
+        # so the host can forward frames without re-encoding.
+        self.codecs = codecs or utils.available_codecs()
+        self.call_codec = None
+        self.send_codec = utils.JpegCodec()
+        # Decode workers; each stream only ever has one batch in flight
+        self.decode_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="decode")
+        self.streams = {}
+        # Display sizes reported by the UI, by stream id (see set_stream_view)
+        self.stream_views = {}
+        self._frame_waiting = None
+        # Received frames skipped because a newer keyframe arrived before they were decoded
+        self.frames_stale = 0
+        # Frames dropped somewhere upstream (gaps in the sequence numbers)
+        self.frames_lost = 0
+        # Frames not decoded because their stream wasn't on screen
+        self.frames_paused = 0
+        # Decoded frames not shown because they missed their playout time
+        self.frames_late = 0
+        # Our camera is off: nothing is encoded or sent
+        self.video_muted = False
+        # Streams whose camera is off, ours included (the host tells newcomers)
+        self.muted_streams = set()
+        # Audio: our capture, the mixer for remote streams, and the call's codec
+        self.audio_capture = None
+        self.audio_player = None
+        self.audio_codecs = audio.available_audio_codecs()
+        self.call_audio_codec = None
+        self.audio_encoder = None
+        self.audio_seq = 0
+        # Chat waiting to be batched: outgoing (filled from the GUI thread) and incoming
+        self._chat_lock = threading.Lock()
+        self._chat_outbox = []
+        self._chat_flush_scheduled = False
+        self._chat_inbox = []
+        # recording.Recorder tapping every encoded message we send or receive, while recording
+        self.recorder = None
+        self.metrics = metrics.CallMetrics()
+        # JSON-lines file for log collectors; also settable via VIRN_METRICS_LOG
+        self.metrics_log = metrics_log or os.environ.get("VIRN_METRICS_LOG")
 
     def set_camera(self, camera):
         self.video_camera = camera
 
+    def set_video_muted(self, muted):
+        """
+        Stops (or restarts) encoding and sending our video, and tells everyone so
+        their decoders stop waiting for frames. The camera itself is paused by the caller.
+        """
+        self.video_muted = muted
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._apply_video_muted, muted)
+
+    def _apply_video_muted(self, muted):
+        if muted:
+            self.muted_streams.add(self.peer_id)
+            # Frames already queued would only be thrown away on the other side
+            for peer in self.peers.values():
+                peer.drop_stream(self.peer_id)
+        else:
+            self.muted_streams.discard(self.peer_id)
+            # Receivers resync from a keyframe
+            self.send_codec.request_keyframe()
+        self._broadcast_control(self._video_muted_message(self.peer_id, muted))
+
+    def _video_muted_message(self, stream_id, muted):
+        return protocol.pack_json(protocol.CONTROL, {"action": "video_muted", "muted": muted}, stream_id=stream_id)
+
+    def set_audio(self, capture=None, player=None):
+        """
+        Attaches an audio.AudioCapture (our microphone) and an audio.AudioPlayer
+        (plays everyone else). Either may be None.
+        """
+        self.audio_capture = capture
+        self.audio_player = player
+        if capture is not None:
+            capture.on_frame = self._on_audio_frame
+
+    def _on_audio_frame(self, pcm, timestamp):
+        """
+        Runs on the audio capture thread: encodes the frame there (a fraction of a
+        millisecond) and hands the packet to the loop for every peer's audio lane.
+        """
+        encoder = self.audio_encoder
+        if encoder is None or not self.peers or not self.running or self.loop is None:
+            return
+        payload = encoder.encode(pcm)
+        if not payload:
+            return
+        self.audio_seq += 1
+        message = protocol.pack(protocol.AUDIO, payload, stream_id=self.peer_id, seq=self.audio_seq,
+                                timestamp=protocol.wall_time_us(timestamp))
+        self._record(message)
+        try:
+            self.loop.call_soon_threadsafe(self._broadcast_audio, message)
+        except RuntimeError:
+            # Loop already closed: the call is ending
+            pass
+
+    def start_recording(self, path=None):
+        """
+        Starts recording the call (as encoded, nothing is re-encoded) to path,
+        by default a new file in the recordings directory. Returns the path.
+        """
+        self.stop_recording()
+        recorder = recording.Recorder(path or recording.new_recording_path())
+        if self.call_codec:
+            recorder.write(self._codecs_hello())
+        self.recorder = recorder
+        if self.loop and self.loop.is_running():
+            # So the recording starts decodable, every stream restarts from a keyframe
+            self.loop.call_soon_threadsafe(self._request_all_keyframes)
+        return recorder.path
+
+    def stop_recording(self):
+        """
+        Finishes the current recording, if any, and returns its stats.
+        """
+        recorder = self.recorder
+        if recorder is None:
+            return None
+        self.recorder = None
+        recorder.close()
+        return recorder.stats()
+
+    def _request_all_keyframes(self):
+        self.send_codec.request_keyframe()
+        for stream in self.streams.values():
+            self._request_keyframe(stream)
+
+    def _codecs_hello(self):
+        # Tells a player which decoders the records that follow need
+        audio_codecs = [self.call_audio_codec] if self.call_audio_codec else []
+        return protocol.hello([self.call_codec], audio_codecs=audio_codecs)
+
+    def _record(self, message):
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.write(message)
+
+    def set_target_fps(self, fps):
+        """
+        Caps the outgoing frame rate; the adaptive controller may go lower.
+        """
+        self.target_fps = fps
+
+    def set_stream_view(self, stream_id, width, height):
+        """
+        Tells the decoder how large a stream is displayed. Small views are decoded at
+        reduced resolution when the codec allows it; (0, 0) pauses decoding entirely
+        (off-screen tile, minimized window) until the stream is shown again.
+        """
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._apply_view, stream_id, (width, height))
+        else:
+            self.stream_views[stream_id] = (width, height)
+
+    def _apply_view(self, stream_id, view_size):
+        self.stream_views[stream_id] = view_size
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            return
+        was_paused = stream.paused
+        stream.view_size = view_size
+        if was_paused and not stream.paused:
+            # Everything since the pause was thrown away; resume from a fresh keyframe
+            self._request_keyframe(stream)
+
     def start_host(self, port):
         """
         Starts a WebSocket server on localhost:port.
         """
         self.running = True
+        self.is_host = True
         self.thread = threading.Thread(target=self._run_server_loop, args=(port,), daemon=True)
         self.thread.start()
 
@@ -42,24 +474,52 @@ class ConnectionManager(QObject):
         Connects to a WebSocket server at uri.
         """
         self.running = True
+        self.is_host = False
         self.thread = threading.Thread(target=self._run_client_loop, args=(uri,), daemon=True)
         self.thread.start()
 
     def stop_connection(self):
         self.running = False
-        # The loop will check 'running' flag or we can cancel tasks,
-        # but for simplicity we rely on the loops checking self.running or breaking on close.
-        if self.websocket:
-            asyncio.run_coroutine_threadsafe(self.websocket.close(), self.loop)
+        # The loops check the 'running' flag; closing the sockets ends their receive loops
+        if self.loop and not self.loop.is_closed():
+            for peer in list(self.peers.values()):
+                asyncio.run_coroutine_threadsafe(peer.websocket.close(), self.loop)
+            if self._stop_event:
+                self.loop.call_soon_threadsafe(self._stop_event.set)
         self.disconnected.emit()
 
     def send_chat_message(self, message):
         """
-        Sends a text message to the peer.
+        Sends a text message to everyone in the call.
+        """
+        if self.peers and self.running:
+            # Messages within CHAT_BATCH_WINDOW go out together; only the first wakes the loop
+            with self._chat_lock:
+                self._chat_outbox.append(message)
+                if self._chat_flush_scheduled:
+                    return
+                self._chat_flush_scheduled = True
+            self.loop.call_soon_threadsafe(self.loop.call_later, CHAT_BATCH_WINDOW, self._flush_chat)
+
+    def _flush_chat(self):
+        """
+        Sends the outbox as few CHAT messages as MAX_CHAT_BATCH_BYTES allows, in order.
         """
-        if self.websocket and self.running:
-            # We must schedule the send in the asyncio loop
-            asyncio.run_coroutine_threadsafe(self.websocket.send(message), self.loop)
+        with self._chat_lock:
+            texts = self._chat_outbox
+            self._chat_outbox = []
+            self._chat_flush_scheduled = False
+        batch, size = [], 0
+        for text in texts:
+            # Measured as sent: JSON escaping can make a text several times longer
+            length = protocol.chat_size(text)
+            if batch and size + length > MAX_CHAT_BATCH_BYTES:
+                self._broadcast_chat(protocol.pack_chat(batch, self.peer_id))
+                batch, size = [], 0
+            batch.append(text)
+            size += length
+        if batch:
+            self._broadcast_chat(protocol.pack_chat(batch, self.peer_id))
 
     def _run_server_loop(self, port):
         self.loop = asyncio.new_event_loop()
@@ -73,33 +533,66 @@ class ConnectionManager(QObject):
             self.loop.close()
 
     async def _serve_forever(self, port):
+        self._stop_event = asyncio.Event()
         # We use 'async with' to manage the server lifecycle properly
         async with websockets.serve(self._handle_connection, "0.0.0.0", port):
-            # Keep the server running until cancelled
-            await asyncio.Future()
-
+            # The host's own pipeline runs for as long as the server does
+            tasks = self._start_pipeline()
+            try:
+                await self._stop_event.wait()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                # The call is over: every remaining tile goes through participant_left
+                for stream_id in list(self.streams):
+                    self._remove_stream(stream_id)
 
     async def _handle_connection(self, websocket):
-        self.websocket = websocket
+        peer_id = self._next_peer_id
+        self._next_peer_id += 1
+        try:
+            audio_codec = await self._negotiate(websocket, peer_id)
+        except websockets.exceptions.ConnectionClosed:
+            return
+        except Exception as e:
+            # One bad link is not the call's failure: refuse it and carry on
+            print(f"Handshake Error (peer {peer_id}): {e}")
+            return
+
+        peer = self._add_peer(peer_id, websocket)
+        peer.receives_audio = audio_codec is not None
+        # Cameras that are already off won't send anything for the newcomer to notice
+        for stream_id in self.muted_streams:
+            peer.send_control(self._video_muted_message(stream_id, True))
+        # The newcomer needs a keyframe of every stream it is about to receive
+        self.send_codec.request_keyframe()
+        for other in self.peers.values():
+            if other is not peer:
+                other.send_control(self._keyframe_request(other.peer_id))
         self.connected.emit()
-        
-        # Start sender task
-        sender_task = asyncio.create_task(self._sender(websocket))
-        
+
         # Receiver loop (this coroutine acts as receiver)
         try:
             async for message in websocket:
                 if not self.running:
                     break
-                self._process_message(message)
+                self._process_message(message, peer)
         except websockets.exceptions.ConnectionClosed:
             pass
         except Exception as e:
-            self.error.emit(f"Receive Error: {e}")
+            # Only this peer is dropped; everyone else stays in the call
+            print(f"Receive Error (peer {peer_id}): {e}")
         finally:
-            self.running = False
-            sender_task.cancel()
-            self.disconnected.emit()
+            self._remove_peer(peer)
+            self._remove_stream(peer_id)
+            for other in self.peers.values():
+                other.drop_stream(peer_id)
+            leave = protocol.pack_json(protocol.CONTROL, {"action": "leave"}, stream_id=peer_id)
+            self._broadcast_control(leave)
+            if not self.peers:
+                # Next call renegotiates from scratch
+                self.call_codec = None
+                self.call_audio_codec = None
 
     def _run_client_loop(self, uri):
         self.loop = asyncio.new_event_loop()
@@ -110,70 +603,563 @@ class ConnectionManager(QObject):
     async def _client_handler(self, uri):
         try:
             async with websockets.connect(uri) as websocket:
-                self.websocket = websocket
+                await self._negotiate(websocket)
+                peer = self._add_peer(0, websocket)
+                if self.video_muted:
+                    self._apply_video_muted(True)
                 self.connected.emit()
-                
-                # Start sender task
-                sender_task = asyncio.create_task(self._sender(websocket))
-                
+
+                tasks = self._start_pipeline()
                 # Receiver loop
                 try:
                     async for message in websocket:
                         if not self.running:
                             break
-                        self._process_message(message)
+                        self._process_message(message, peer)
                 except websockets.exceptions.ConnectionClosed:
                     pass
                 finally:
-                    sender_task.cancel()
+                    for task in tasks:
+                        task.cancel()
+                    self._remove_peer(peer)
 
         except Exception as e:
             self.error.emit(f"Client Connection Error: {e}")
         finally:
             self.running = False
+            for stream_id in list(self.streams):
+                self._remove_stream(stream_id)
             self.disconnected.emit()
 
-    async def _sender(self, websocket):
+    def _start_pipeline(self):
         """
-        Continuously captures and sends frames.
+        Starts the shared encoder, decoder and stats tasks. Returns them for cancellation.
         """
+        self._frame_waiting = asyncio.Event()
+        self.metrics.reset()
+        return [
+            asyncio.create_task(self._encoder()),
+            asyncio.create_task(self._decoder()),
+            asyncio.create_task(self._reporter()),
+        ]
+
+    def _add_peer(self, peer_id, websocket):
+        peer = Peer(peer_id, websocket, QualityController(self.quality_ladder, self.quality_start))
+        peer.sender_task = asyncio.create_task(self._peer_sender(peer))
+        self.peers[peer_id] = peer
+        return peer
+
+    def _quality_profile(self):
+        """
+        The rung the shared encoder uses: one stream goes to every peer, so it is the
+        lowest rung across connected peers (the starting rung while there are none).
+        """
+        rungs = [peer.quality.rung for peer in list(self.peers.values())]
+        return self.quality_ladder[min(rungs) if rungs else self.quality_start]
+
+    def _remove_peer(self, peer):
+        peer.sender_task.cancel()
+        self.peers.pop(peer.peer_id, None)
+
+    def _remove_stream(self, stream_id):
+        self.muted_streams.discard(stream_id)
+        if self.audio_player is not None:
+            self.audio_player.remove_stream(stream_id)
+        if self.streams.pop(stream_id, None) is not None:
+            self.participant_left.emit(stream_id)
+
+    async def _negotiate(self, websocket, peer_id=None):
+        """
+        Exchanges hello messages: checks the peer speaks our protocol version and
+        settles the call codec, which is the host's most preferred codec the peer
+        supports. Once a call is running the host only offers the codec in use.
+        A peer that can't use the call's audio codec joins without audio.
+        Returns the audio codec agreed with this peer (None: video only).
+        Raises ValueError for incompatible peers.
+        """
+        if self.is_host:
+            offered = [self.call_codec] if self.call_codec else self.codecs
+            offered_audio = [self.call_audio_codec] if self.call_audio_codec else self.audio_codecs
+            await websocket.send(protocol.hello(offered, peer_id=peer_id, audio_codecs=offered_audio))
+        else:
+            await websocket.send(protocol.hello(self.codecs, audio_codecs=self.audio_codecs))
+
+        try:
+            message = protocol.unpack(await asyncio.wait_for(websocket.recv(), HANDSHAKE_TIMEOUT))
+        except asyncio.TimeoutError:
+            raise ValueError("Peer did not complete the handshake")
+        if message.type != protocol.HELLO:
+            raise ValueError("Peer did not start with a hello")
+
+        hello = protocol.unpack_json(message.payload)
+        if hello.get("version") != protocol.PROTOCOL_VERSION:
+            raise ValueError(f"Peer speaks protocol version {hello.get('version')}, "
+                             f"expected {protocol.PROTOCOL_VERSION}")
+
+        peer_codecs = hello.get("codecs", [])
+        peer_audio_codecs = hello.get("audio_codecs", [])
+        if self.is_host:
+            codec = utils.negotiate_codec(offered, peer_codecs)
+            if self.call_codec and codec != self.call_codec:
+                raise ValueError(f"Peer can't use the call's {self.call_codec} codec")
+            audio_codec = audio.negotiate_audio_codec(offered_audio, peer_audio_codecs)
+        else:
+            codec = utils.negotiate_codec(peer_codecs, self.codecs)
+            audio_codec = audio.negotiate_audio_codec(peer_audio_codecs, self.audio_codecs)
+            self.peer_id = hello.get("peer_id", 0)
+
+        if codec != self.call_codec:
+            self.call_codec = codec
+            self.send_codec = utils.create_codec(codec)
+        # No shared audio codec (e.g. a peer without PyAV, or without audio at all) means
+        # video only for that peer; on the host, the call's codec stays for everyone else
+        if audio_codec != self.call_audio_codec and (audio_codec or not self.is_host):
+            self.call_audio_codec = audio_codec
+            self.audio_encoder = audio.create_audio_codec(audio_codec) if audio_codec else None
+            if self.audio_player is not None and audio_codec:
+                self.audio_player.set_codec(audio_codec)
+        if self.recorder is not None:
+            self._record(self._codecs_hello())
+        return audio_codec
+
+    async def _peer_sender(self, peer):
+        """
+        Drains one peer's outbound lanes. Runs per peer, so a congested link
+        backs up (and drops) only its own frames.
+        """
+        websocket = peer.websocket
+        try:
+            while self.running:
+                lane, payload = await peer.next_message()
+                started = time.monotonic()
+                # Sampled first: send() only returns once the buffer is under its
+                # high-water mark again, so afterwards it never looks backed up
+                buffered = write_buffer_size(websocket) + len(payload)
+                await websocket.send(payload)
+                if lane != LANE_VIDEO:
+                    continue
+                if protocol.unpack(payload).stream_id != self.peer_id:
+                    # Forwarded frames: the sender's metrics and quality are its own business
+                    self.metrics.count("frames_forwarded")
+                    continue
+                drain_time = time.monotonic() - started
+                # Only this link's state: a fast peer's quick sends can't mask a slow one
+                peer.quality.record_send(drain_time, buffered)
+                self.metrics.record("send", drain_time * 1000)
+                self.metrics.frame_sent(len(payload))
+        except asyncio.CancelledError:
+            pass
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            self.metrics.count("send_errors")
+            print(f"Send Error: {e}")
+
+    async def _encoder(self):
+        """
+        Captures frames at the pacer's target FPS, encodes them once in the worker pool
+        (cv2 releases the GIL) and queues the result for every peer, so the event loop
+        keeps serving receive, forwarding and chat.
+        """
+        loop = asyncio.get_running_loop()
+        last_seq = 0
+        video_seq = 0
+        self.pacer.reset()
         while self.running:
             try:
-                frame = self.video_camera.get_frame()
-                if frame is not None:
-                    jpeg_bytes = utils.encode_frame(frame)
-                    await websocket.send(jpeg_bytes)
-                
-                # ~15 FPS
-                await asyncio.sleep(0.066)
+                profile = self._quality_profile()
+                fps = min(profile.fps, self.target_fps)
+                if fps != self.pacer.fps:
+                    self.pacer.set_fps(fps)
+
+                await self.pacer.wait()
+                if self.video_camera is None or self.video_muted or not self.peers:
+                    continue
+                seq, captured_at, frame = self.video_camera.get_latest()
+                # Only send frames we haven't sent yet
+                if frame is None or seq == last_seq:
+                    continue
+                last_seq = seq
+
+                codec = self.send_codec
+                # Frames arrive at the call's capture size: only shrink them for lower rungs
+                size = (profile.width, profile.height)
+                if size[0] >= frame.shape[1] or size[1] >= frame.shape[0]:
+                    size = None
+                started = time.monotonic()
+                self.metrics.record("capture", (started - captured_at) * 1000)
+                payload = await loop.run_in_executor(
+                    self.encode_pool, codec.encode, frame, profile.quality, size)
+                self.metrics.record("encode", (time.monotonic() - started) * 1000)
+                # None means the picture didn't change: nothing to send
+                if payload is None:
+                    continue
+
+                video_seq += 1
+                flags = protocol.FLAG_KEYFRAME if codec.is_keyframe(payload) else 0
+                message = protocol.pack(protocol.VIDEO, payload, stream_id=self.peer_id, seq=video_seq,
+                                        timestamp=protocol.wall_time_us(captured_at), flags=flags)
+                self._record(message)
+                # A peer that misses an update asks for a keyframe once it spots the gap
+                for peer in self.peers.values():
+                    if peer.queue_video(self.peer_id, message):
+                        self.frames_dropped += 1
             except asyncio.CancelledError:
                 break
             except Exception as e:
-                # print(f"Send Error: {e}")
+                self.metrics.count("encode_errors")
+                print(f"Encode Error: {e}")
                 break
 
-    def _process_message(self, message):
+    def _process_message(self, raw, peer):
         """
-        Decodes a received message (Text or Bytes) and emits it.
+        Dispatches a received message by its header type.
+        On the host, video and chat are also forwarded as-is to the other peers.
+        Chat is emitted right away; video frames are handed to the decode stage.
         """
         try:
-            if isinstance(message, str):
-                self.chat_message_received.emit(message)
-                return
+            message = protocol.unpack(raw)
+        except ValueError:
+            print("Ignoring non-protocol message")
+            return
+        try:
+            self._dispatch(raw, message, peer)
+        except (ValueError, UnicodeDecodeError, AttributeError) as e:
+            # Bad JSON, bad UTF-8 or a control that isn't an object: drop just this message
+            self.metrics.count("malformed")
+            print(f"Ignoring malformed {message.type} message: {e}")
 
-            # Assume binary is video frame
-            frame = utils.decode_frame(message)
-            if frame is None:
+    def _dispatch(self, raw, message, peer):
+        if self.is_host and message.type in (protocol.VIDEO, protocol.AUDIO, protocol.CHAT):
+            if message.stream_id != peer.peer_id:
+                # Peers may only speak for their own stream
                 return
+            self._forward(raw, message, peer)
+        if self.recorder is not None and message.type in RECORDED_TYPES:
+            self._record(raw)
 
-            height, width, channel = frame.shape
-            bytes_per_line = 3 * width
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            # MUST copy() the image, because QImage(data, ...) uses the buffer directly.
-            # If we don't copy, 'frame_rgb' is GC'd after this function ends, causing a Segfault.
-            q_img = QImage(frame_rgb.data, width, height, bytes_per_line, QImage.Format.Format_RGB888).copy()
-            
-            # emit must be thread-safe (signals are)
-            self.new_frame_received.emit(q_img)
-        except Exception as e:
-            print(f"Frame Decode Error: {e}")
+        if message.type == protocol.CHAT:
+            self._receive_chat(protocol.unpack_chat(message))
+        elif message.type == protocol.VIDEO:
+            self._queue_frame(message)
+        elif message.type == protocol.AUDIO:
+            if self.audio_player is not None and self.call_audio_codec:
+                self.audio_player.add_packet(message.stream_id, message.seq, message.timestamp, message.payload)
+        elif message.type == protocol.CONTROL:
+            self._handle_control(raw, message, peer)
+        elif message.type == protocol.PING:
+            # Echo the sender's own timestamp back, so RTT needs no clock sync
+            pong = protocol.pack(protocol.PONG, timestamp=message.timestamp)
+            peer.send_control(pong)
+        elif message.type == protocol.PONG:
+            self.metrics.set_rtt((protocol.wall_time_us() - message.timestamp) / 1000)
+        # Unknown types are ignored, so newer peers can add stream types
+
+    def _forward(self, raw, message, source):
+        """
+        Selective forwarding: relays a participant's message to everyone else without
+        touching the payload. Video and audio go through each peer's drop-oldest queues.
+        """
+        for peer in self.peers.values():
+            if peer is source:
+                continue
+            if message.type == protocol.VIDEO:
+                if peer.queue_video(message.stream_id, raw):
+                    self.frames_dropped += 1
+            elif message.type == protocol.AUDIO:
+                if peer.queue_audio(raw):
+                    self.metrics.count("audio_dropped")
+            else:
+                peer.send_chat(raw)
+
+    def _queue_frame(self, message):
+        self.metrics.frame_received(len(message.payload))
+        self.metrics.record("transit", (protocol.wall_time_us() - message.timestamp) / 1000)
+
+        stream = self._get_stream(message.stream_id)
+
+        keyframe = message.flags & protocol.FLAG_KEYFRAME
+        # Gaps in the sequence are frames dropped upstream; what follows can't be decoded
+        if stream.last_seq is not None and message.seq > stream.last_seq + 1:
+            self.frames_lost += message.seq - stream.last_seq - 1
+            if not keyframe:
+                stream.waiting_for_keyframe = True
+                self._request_keyframe(stream)
+        stream.last_seq = message.seq
+
+        if stream.paused:
+            # Nobody is looking: skip decoding, and resync with a keyframe when shown again
+            self.frames_paused += 1
+            stream.pending = []
+            stream.waiting_for_keyframe = True
+            return
+
+        # A keyframe makes every undecoded frame before it stale;
+        # inter-frame updates build on each other, so those are queued behind it instead.
+        if keyframe:
+            self.frames_stale += len(stream.pending)
+            stream.pending = []
+            stream.waiting_for_keyframe = False
+        elif stream.waiting_for_keyframe:
+            self._request_keyframe(stream)
+            return
+        stream.pending.append(message)
+        self._frame_waiting.set()
+
+    def _handle_control(self, raw, message, source):
+        control = protocol.unpack_json(message.payload)
+        action = control.get("action")
+        if action == "video_muted":
+            if self.is_host:
+                if message.stream_id != source.peer_id:
+                    # Peers may only switch their own camera
+                    return
+                for peer in self.peers.values():
+                    if peer is not source:
+                        peer.send_control(raw)
+            self._set_stream_muted(message.stream_id, bool(control.get("muted")))
+            return
+        if action == "keyframe":
+            if message.stream_id == self.peer_id:
+                self.send_codec.request_keyframe()
+            elif self.is_host and message.stream_id in self.peers:
+                # Someone wants a keyframe of another participant: pass it on
+                self.peers[message.stream_id].send_control(raw)
+        elif action == "leave":
+            self._remove_stream(message.stream_id)
+
+    def _set_stream_muted(self, stream_id, muted):
+        """
+        A participant's camera went off (or on): stop decoding its stream, or
+        wait for the keyframe it sends on resuming.
+        """
+        stream = self._get_stream(stream_id)
+        if muted:
+            self.muted_streams.add(stream_id)
+            stream.pending = []
+        else:
+            self.muted_streams.discard(stream_id)
+        stream.waiting_for_keyframe = True
+        self.participant_video_muted.emit(stream_id, muted)
+
+    def _get_stream(self, stream_id):
+        """
+        The receive state for stream_id, created (and announced to the UI) on first use.
+        """
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            codec = utils.create_codec(self.call_codec or utils.JpegCodec.name)
+            stream = RemoteStream(stream_id, codec, self.stream_views.get(stream_id))
+            self.streams[stream_id] = stream
+            self.participant_joined.emit(stream_id)
+        return stream
+
+    def _keyframe_request(self, stream_id):
+        return protocol.pack_json(protocol.CONTROL, {"action": "keyframe"}, stream_id=stream_id)
+
+    def _request_keyframe(self, stream):
+        """
+        Asks a stream's sender for a keyframe, at most once per interval.
+        The host asks the participant directly; clients go through the host.
+        """
+        now = time.monotonic()
+        if now - stream.last_keyframe_request < KEYFRAME_REQUEST_INTERVAL:
+            return
+        stream.last_keyframe_request = now
+        link = self.peers.get(stream.stream_id if self.is_host else 0)
+        if link is not None:
+            link.send_control(self._keyframe_request(stream.stream_id))
+
+    def _receive_chat(self, texts):
+        """
+        Collects incoming chat for CHAT_BATCH_WINDOW, so a burst is one UI update.
+        """
+        if not self._chat_inbox:
+            asyncio.get_running_loop().call_later(CHAT_BATCH_WINDOW, self._deliver_chat)
+        self._chat_inbox.extend(texts)
+
+    def _deliver_chat(self):
+        texts = self._chat_inbox
+        self._chat_inbox = []
+        if texts:
+            self.chat_messages_received.emit(texts)
+
+    def _broadcast_chat(self, message):
+        self._record(message)
+        for peer in self.peers.values():
+            peer.send_chat(message)
+
+    def _broadcast_audio(self, message):
+        for peer in self.peers.values():
+            if peer.queue_audio(message):
+                self.metrics.count("audio_dropped")
+
+    def _broadcast_control(self, message):
+        for peer in self.peers.values():
+            peer.send_control(message)
+
+    async def _reporter(self):
+        """
+        Once per interval: pings the peers for RTT, publishes a stats snapshot
+        to the UI and appends it to the metrics log if one is configured.
+        """
+        loop = asyncio.get_running_loop()
+        while self.running:
+            try:
+                await asyncio.sleep(STATS_INTERVAL)
+                self._broadcast_control(protocol.pack(protocol.PING))
+                stats = self.get_stats()
+                self.stats_updated.emit(stats)
+                if self.metrics_log:
+                    # File I/O stays off the event loop
+                    await loop.run_in_executor(None, metrics.append_json_line, self.metrics_log, stats)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"Metrics Error: {e}")
+
+    def get_stats(self):
+        """
+        Metrics snapshot plus the pipeline's drop counters and current send profile.
+        """
+        stats = self.metrics.snapshot()
+        stats["dropped"] = {
+            "send_queue": self.frames_dropped,
+            "stale": self.frames_stale,
+            "lost": self.frames_lost,
+            "paused": self.frames_paused,
+            "late": self.frames_late,
+            "static": getattr(self.send_codec, "frames_skipped", 0),
+            "paced": self.pacer.frames_skipped,
+        }
+        stats["profile"] = self._quality_profile()._asdict()
+        codec = self.send_codec.name
+        stats["codecs"] = {"send": codec, "recv": self.call_codec or codec}
+        stats["peers"] = len(self.peers)
+        stats["streams"] = len(self.streams)
+        stats["pacer_fps"] = self.pacer.achieved_fps()
+        stats["pacer_jitter_ms"] = self.pacer.jitter() * 1000
+        stats["codecs"]["audio"] = self.call_audio_codec
+        if self.audio_player is not None:
+            stats["audio"] = self.audio_player.stats()
+        recorder = self.recorder
+        if recorder is not None:
+            stats["recording"] = recorder.stats()
+        return stats
+
+    def frame_rendered(self, video_frame):
+        """
+        Called by the UI once a received frame is on screen.
+        """
+        now = time.monotonic()
+        self.metrics.record("render", (now - video_frame.decoded_at) * 1000)
+        self.metrics.record("end_to_end", (protocol.wall_time_us() - video_frame.timestamp) / 1000)
+        if self.audio_player is not None:
+            audio_now = self.audio_player.clock(video_frame.stream_id)
+            if audio_now is not None:
+                # Positive: the picture is ahead of the sound
+                self.metrics.record("av_skew", (video_frame.timestamp - audio_now) / 1000)
+
+    def _schedule_frame(self, stream, video_frame):
+        """
+        Hands a decoded frame to the UI when its playout clock says it's due: early
+        frames are held, late ones dropped if a newer frame is already on its way.
+        """
+        audio_now = self.audio_player.clock(stream.stream_id) if self.audio_player else None
+        delay = stream.playout.delay(video_frame.timestamp, audio_now)
+        if delay < -VIDEO_LATE_THRESHOLD and stream.pending:
+            self.frames_late += 1
+        elif delay > 0:
+            asyncio.get_running_loop().call_later(min(delay, MAX_VIDEO_HOLD),
+                                                  self._present_frame, stream, video_frame)
+        else:
+            self._present_frame(stream, video_frame)
+
+    def _present_frame(self, stream, video_frame):
+        # A newer frame may have gone out while this one was held, or the stream left
+        if video_frame.timestamp <= stream.presented_ts or self.streams.get(stream.stream_id) is not stream:
+            return
+        if stream.stream_id in self.muted_streams:
+            return
+        stream.presented_ts = video_frame.timestamp
+        # emit must be thread-safe (signals are)
+        self.new_frame_received.emit(video_frame)
+
+    async def _decoder(self):
+        """
+        Decodes received frames in the worker pool, starting from each stream's newest
+        keyframe, so a burst of frames never backs up the receive loop.
+        Streams are decoded concurrently; each stream has at most one batch in flight,
+        at the smallest resolution its tile needs.
+        """
+        loop = asyncio.get_running_loop()
+        while self.running:
+            try:
+                await self._frame_waiting.wait()
+                self._frame_waiting.clear()
+                batches = []
+                for stream in self.streams.values():
+                    if stream.pending:
+                        reduce = 1
+                        if stream.codec.supports_reduce:
+                            reduce = utils.reduce_factor(stream.frame_size, stream.view_size)
+                        batches.append((stream, stream.pending, reduce))
+                        stream.pending = []
+                if not batches:
+                    continue
+
+                started = time.monotonic()
+                video_frames = await asyncio.gather(*[
+                    loop.run_in_executor(self.decode_pool, decode_to_image, stream.codec, messages, reduce)
+                    for stream, messages, reduce in batches])
+                self.metrics.record("decode", (time.monotonic() - started) * 1000)
+
+                for (stream, _, reduce), video_frame in zip(batches, video_frames):
+                    if video_frame is not None:
+                        stream.frame_size = (video_frame.width() * reduce, video_frame.height() * reduce)
+                        self._schedule_frame(stream, video_frame)
+                    else:
+                        # Missing the frames this one builds on; resync from a fresh keyframe
+                        stream.waiting_for_keyframe = True
+                        self._request_keyframe(stream)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self.metrics.count("decode_errors")
+                print(f"Frame Decode Error: {e}")
+
+def write_buffer_size(websocket):
+    """
+    Bytes queued in the websocket's transport but not yet handed to the OS.
+    """
+    transport = getattr(websocket, "transport", None)
+    if transport is None:
+        return 0
+    return transport.get_write_buffer_size()
+
+def write_buffer_limits(websocket):
+    """
+    (low, high) water marks of the websocket's transport buffer, or None if unknown.
+    """
+    transport = getattr(websocket, "transport", None)
+    if transport is None:
+        return None
+    try:
+        return transport.get_write_buffer_limits()
+    except (AttributeError, NotImplementedError):
+        return None
+
+def decode_to_image(decoder, messages, reduce=1):
+    """
+    Feeds queued video messages through the decoder and wraps the last frame in a
+    display-ready VideoFrame (runs in a worker thread). The decoded buffer is the
+    only per-frame allocation: the QImage views it directly.
+    Returns None if nothing could be decoded.
+    """
+    frame = None
+    for message in messages:
+        frame = decoder.decode(message.payload, reduce)
+    if frame is None:
+        return None
+    last = messages[-1]
+    return video.VideoFrame(frame, last.timestamp, last.stream_id)
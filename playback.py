@@ -0,0 +1,254 @@
+import threading
+import time
+from PyQt6.QtCore import QObject, pyqtSignal
+import protocol
+import recording
+import utils
+import video
+
+# Playback position updates sent to the UI, at most this often (seconds)
+POSITION_INTERVAL = 0.25
+# Longest the playback thread sleeps before checking for seeks, pauses and stop
+MAX_WAIT = 0.1
+# Decoded frames this far (seconds) behind schedule are not shown, so playback catches up
+LATE_THRESHOLD = 0.1
+
+class RecordingPlayer(QObject):
+    """
+    Plays a recording (see recording.py) through the same signals as
+    network.ConnectionManager, so VideoCallWidget renders it like a live call.
+    Records are read from the memory-mapped file one at a time, paced by their
+    recorded times; seek() finds its starting record by binary search in the
+    index and each video stream resumes from the keyframe its index entry points to.
+    """
+    connected = pyqtSignal()
+    disconnected = pyqtSignal()
+    error = pyqtSignal(str)
+    chat_messages_received = pyqtSignal(list) # texts, oldest first
+    stats_updated = pyqtSignal(dict)
+    new_frame_received = pyqtSignal(object) # video.VideoFrame
+    participant_joined = pyqtSignal(int) # stream id
+    participant_left = pyqtSignal(int) # stream id
+    participant_video_muted = pyqtSignal(int, bool) # stream id, camera off
+    position_changed = pyqtSignal(int, int) # position, duration (microseconds)
+
+    def __init__(self, path):
+        super().__init__()
+        self.recording = recording.Recording(path)
+        self.audio_player = None
+        # Playback never records; the call UI checks this
+        self.recorder = None
+        self.running = False
+        self.paused = False
+        self.thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._seek_to = None
+        # Next record to play, and where that puts us on the wall clock
+        self.position = 0
+        self._started_at = 0.0
+        self._paused_at_us = 0
+        # Codecs from the latest HELLO record, and one decoder per video stream
+        self.video_codec = None
+        self.audio_codec = None
+        self.decoders = {}
+        # Streams decoding cleanly since the last seek (started from a keyframe)
+        self.synced = set()
+        self.streams = set()
+        self.stream_views = {}
+        # Last chat record handed to the UI. The chat panel holds everything up to it, so
+        # seeking back doesn't repeat chat and seeking ahead first delivers what was skipped.
+        self.chat_shown = -1
+
+    @property
+    def duration_us(self):
+        return self.recording.duration_us
+
+    # Parts of ConnectionManager's interface the call UI uses that mean nothing here
+
+    def set_camera(self, camera):
+        pass
+
+    def set_audio(self, capture=None, player=None):
+        self.audio_player = player
+
+    def set_video_muted(self, muted):
+        pass
+
+    def send_chat_message(self, message):
+        pass
+
+    def frame_rendered(self, video_frame):
+        pass
+
+    def set_stream_view(self, stream_id, width, height):
+        self.stream_views[stream_id] = (width, height)
+
+    def stop_recording(self):
+        return None
+
+    def start(self):
+        self.running = True
+        self.seek(0)
+        self.thread = threading.Thread(target=self._play_loop, daemon=True)
+        self.thread.start()
+        self.connected.emit()
+
+    def stop_connection(self):
+        if not self.running:
+            return
+        self.running = False
+        self._wake.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        for stream_id in list(self.streams):
+            self.participant_left.emit(stream_id)
+        self.streams.clear()
+        self.recording.close()
+        self.disconnected.emit()
+
+    def seek(self, time_us):
+        """
+        Continues playback from time_us (microseconds from the start).
+        """
+        with self._lock:
+            self._seek_to = max(0, min(int(time_us), self.duration_us))
+        self._wake.set()
+
+    def pause(self):
+        with self._lock:
+            if not self.paused:
+                self._paused_at_us = self._now_us()
+                self.paused = True
+
+    def resume(self):
+        with self._lock:
+            if self.paused:
+                self.paused = False
+                self._started_at = time.monotonic() - self._paused_at_us / 1_000_000
+        self._wake.set()
+
+    def _now_us(self):
+        if self.paused:
+            return self._paused_at_us
+        return int((time.monotonic() - self._started_at) * 1_000_000)
+
+    def _play_loop(self):
+        last_position_update = 0.0
+        while self.running:
+            with self._lock:
+                seeked = self._seek_to is not None
+                if seeked:
+                    self._apply_seek(self._seek_to)
+                    self._seek_to = None
+                paused = self.paused
+                now_us = self._now_us()
+            if seeked:
+                # Outside the lock: seek(), pause() and resume() never wait on this
+                self._catch_up_chat()
+
+            if time.monotonic() - last_position_update >= POSITION_INTERVAL:
+                last_position_update = time.monotonic()
+                self.position_changed.emit(min(now_us, self.duration_us), self.duration_us)
+
+            if paused or self.position >= len(self.recording):
+                self._wake.wait(MAX_WAIT)
+                self._wake.clear()
+                continue
+
+            entry = self.recording.entry(self.position)
+            if entry.time_us > now_us:
+                self._wake.wait(min((entry.time_us - now_us) / 1_000_000, MAX_WAIT))
+                self._wake.clear()
+                continue
+            try:
+                late = (now_us - entry.time_us) / 1_000_000 > LATE_THRESHOLD
+                self._play(self.position, entry, show=not late)
+            except Exception as e:
+                print(f"Playback Error: {e}")
+            self.position += 1
+
+    def _apply_seek(self, time_us):
+        self.position = self.recording.find(time_us)
+        self._started_at = time.monotonic() - time_us / 1_000_000
+        self._paused_at_us = time_us
+        # Decoders restart from keyframes; queued audio belongs to the old position
+        self.decoders = {}
+        self.synced.clear()
+        if self.audio_player is not None:
+            self.audio_player.clear()
+        if self.position < len(self.recording):
+            hello = self.recording.entry(self.position).hello
+            if hello != recording.NO_ENTRY:
+                self._set_codecs(self.recording.message(hello))
+
+    def _catch_up_chat(self):
+        # Chat a forward seek skipped over is shown at once, so the panel stays complete
+        if self.position <= self.chat_shown + 1:
+            return
+        texts = []
+        for index in self.recording.chat_between(self.chat_shown + 1, self.position):
+            texts.extend(protocol.unpack_chat(self.recording.message(index)))
+        self.chat_shown = self.position - 1
+        if texts:
+            self.chat_messages_received.emit(texts)
+
+    def _set_codecs(self, message):
+        hello = protocol.unpack_json(message.payload)
+        codecs = hello.get("codecs") or [None]
+        audio_codecs = hello.get("audio_codecs") or [None]
+        if codecs[0] != self.video_codec:
+            self.video_codec = codecs[0]
+            self.decoders = {}
+            self.synced.clear()
+        if audio_codecs[0] != self.audio_codec:
+            self.audio_codec = audio_codecs[0]
+            if self.audio_player is not None and self.audio_codec:
+                self.audio_player.set_codec(self.audio_codec)
+
+    def _play(self, index, entry, show=True):
+        if entry.type == protocol.HELLO:
+            self._set_codecs(self.recording.message(index))
+        elif entry.type == protocol.VIDEO:
+            self._play_video(index, entry, show)
+        elif entry.type == protocol.AUDIO:
+            if self.audio_player is not None and self.audio_codec:
+                message = self.recording.message(index)
+                self.audio_player.add_packet(message.stream_id, message.seq, message.timestamp, message.payload)
+        elif entry.type == protocol.CHAT and index > self.chat_shown:
+            self.chat_shown = index
+            self.chat_messages_received.emit(protocol.unpack_chat(self.recording.message(index)))
+
+    def _play_video(self, index, entry, show):
+        if self.video_codec is None:
+            return
+        stream_id = entry.stream_id
+        if stream_id not in self.streams:
+            self.streams.add(stream_id)
+            self.participant_joined.emit(stream_id)
+        if self.stream_views.get(stream_id) == (0, 0):
+            # Off screen: skip decoding, and resync from a keyframe once shown again
+            self.synced.discard(stream_id)
+            return
+        decoder = self.decoders.get(stream_id)
+        if decoder is None:
+            decoder = utils.create_codec(self.video_codec)
+            self.decoders[stream_id] = decoder
+
+        if stream_id not in self.synced:
+            if entry.keyframe == recording.NO_ENTRY:
+                # Nothing decodable yet: the recording started between keyframes
+                return
+            # Catch up from the stream's latest keyframe (at most one keyframe interval)
+            for previous in range(entry.keyframe, index):
+                previous_entry = self.recording.entry(previous)
+                if previous_entry.type == protocol.VIDEO and previous_entry.stream_id == stream_id:
+                    decoder.decode(self.recording.message(previous).payload)
+            self.synced.add(stream_id)
+
+        message = self.recording.message(index)
+        frame = decoder.decode(message.payload)
+        if frame is not None and show:
+            # emit is thread-safe; the VideoFrame keeps the decoded buffer alive
+            self.new_frame_received.emit(video.VideoFrame(frame, message.timestamp, stream_id))
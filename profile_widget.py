@@ -1,8 +1,12 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QLabel, QTextEdit, 
-                             QPushButton, QHBoxLayout, QFrame, QScrollArea)
+                             QPushButton, QHBoxLayout, QFrame, QScrollArea, QComboBox)
 from PyQt6.QtCore import Qt
 from user_profile import UserProfile
 
+# Capture settings offered for calls; the sender's quality ladder tops out at 640x480
+RESOLUTIONS = [(640, 480), (480, 360), (320, 240)]
+FRAME_RATES = [30, 15, 10]
+
 class ProfileWidget(QWidget):
     def __init__(self):
         super().__init__()
@@ -38,6 +42,28 @@ class ProfileWidget(QWidget):
         sep1.setStyleSheet("color: #333;")
         layout.addWidget(sep1)
 
+        # Video Settings (applied to the next call)
+        video_label = QLabel("Video")
+        video_label.setStyleSheet("color: #aaaaaa; font-weight: bold;")
+        layout.addWidget(video_label)
+
+        combo_style = "background: #2d2d2d; border: 1px solid #3d3d3d; border-radius: 8px; padding: 6px;"
+        video_row = QHBoxLayout()
+        self.resolution_input = QComboBox()
+        for width, height in RESOLUTIONS:
+            self.resolution_input.addItem(f"{width} x {height}", (width, height))
+        self.resolution_input.setCurrentIndex(max(0, self.resolution_input.findData(tuple(self.user_profile.video_resolution))))
+        self.resolution_input.setStyleSheet(combo_style)
+        video_row.addWidget(self.resolution_input)
+
+        self.fps_input = QComboBox()
+        for fps in FRAME_RATES:
+            self.fps_input.addItem(f"{fps} fps", fps)
+        self.fps_input.setCurrentIndex(max(0, self.fps_input.findData(self.user_profile.video_fps)))
+        self.fps_input.setStyleSheet(combo_style)
+        video_row.addWidget(self.fps_input)
+        layout.addLayout(video_row)
+
         # Captions Text
         cap_label = QLabel("Simulated Captions Text")
         cap_label.setStyleSheet("color: #aaaaaa; font-weight: bold;")
@@ -94,5 +120,8 @@ class ProfileWidget(QWidget):
         captions = self.captions_input.toPlainText()
         mom = self.mom_input.toPlainText()
         
-        self.user_profile.update_settings(captions, mom)
+        resolution = self.resolution_input.currentData()
+        fps = self.fps_input.currentData()
+        
+        self.user_profile.update_settings(captions, mom, resolution, fps)
         self.close()
@@ -0,0 +1,91 @@
+import collections
+import json
+import struct
+import time
+
+# Bumped whenever the header layout or the meaning of a message type changes
+PROTOCOL_VERSION = 1
+
+# Message types
+HELLO = 0
+VIDEO = 1
+AUDIO = 2
+CHAT = 3
+CONTROL = 4
+PING = 5
+PONG = 6
+
+# Flags
+FLAG_KEYFRAME = 0x01
+# CHAT payload is a JSON list of messages instead of one UTF-8 string
+FLAG_BATCH = 0x02
+
+# type, flags, stream id, sequence number, capture timestamp (wall clock, microseconds)
+HEADER = struct.Struct("!BBHIQ")
+
+Message = collections.namedtuple("Message", "type flags stream_id seq timestamp payload")
+
+def wall_time_us(monotonic_ts=None):
+    """
+    Wall-clock time in microseconds, comparable across machines (given NTP).
+    A time.monotonic() capture timestamp can be passed to convert it.
+    """
+    now = time.time()
+    if monotonic_ts is not None:
+        now -= time.monotonic() - monotonic_ts
+    return int(now * 1_000_000)
+
+def pack(msg_type, payload=b"", stream_id=0, seq=0, timestamp=None, flags=0):
+    """
+    Prefixes payload with a header. timestamp defaults to now.
+    """
+    if timestamp is None:
+        timestamp = wall_time_us()
+    return HEADER.pack(msg_type, flags, stream_id, seq & 0xFFFFFFFF, timestamp) + payload
+
+def unpack(message):
+    """
+    Splits a received message into a Message.
+    The payload is a memoryview into the original buffer, so nothing is copied.
+    Raises ValueError for messages that don't follow the protocol.
+    """
+    if isinstance(message, str) or len(message) < HEADER.size:
+        raise ValueError("Not a protocol message")
+    msg_type, flags, stream_id, seq, timestamp = HEADER.unpack_from(message)
+    return Message(msg_type, flags, stream_id, seq, timestamp, memoryview(message)[HEADER.size:])
+
+def pack_json(msg_type, data, stream_id=0):
+    return pack(msg_type, json.dumps(data).encode("utf-8"), stream_id)
+
+def unpack_json(payload):
+    return json.loads(bytes(payload).decode("utf-8"))
+
+def pack_chat(texts, stream_id=0):
+    """
+    One CHAT message carrying texts, in order. A single text is sent plain.
+    """
+    if len(texts) == 1:
+        return pack(CHAT, texts[0].encode("utf-8"), stream_id)
+    return pack(CHAT, json.dumps(texts).encode("utf-8"), stream_id, flags=FLAG_BATCH)
+
+def chat_size(text):
+    """
+    Bytes text takes up in a batched pack_chat() payload: its json.dumps escaping plus
+    its share of brackets and ", " separators, so a batch's payload is the sum over its texts.
+    """
+    return len(json.dumps(text)) + 2
+
+def unpack_chat(message):
+    """
+    The list of texts in a CHAT Message.
+    """
+    if message.flags & FLAG_BATCH:
+        return unpack_json(message.payload)
+    return [bytes(message.payload).decode("utf-8")]
+
+def hello(codecs, **fields):
+    """
+    First message on every connection: protocol version, supported codecs
+    and any role-specific fields (e.g. the peer id the host assigns).
+    """
+    return pack_json(HELLO, dict(fields, version=PROTOCOL_VERSION, codecs=codecs))
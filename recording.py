@@ -0,0 +1,264 @@
+import collections
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+
+import protocol
+
+# A recording is this magic followed by records: each record is a RECORD_HEADER
+# (message length, microseconds since the recording started) and one protocol
+# message exactly as it went over the wire. HELLO records carry the codecs in use.
+RECORDING_MAGIC = b"VIRNREC1"
+RECORD_HEADER = struct.Struct("!IQ")
+RECORDING_EXTENSION = ".virnrec"
+# Written alongside each recording (path + INDEX_SUFFIX): INDEX_MAGIC, then one
+# fixed-size INDEX_ENTRY per record, so a player can binary-search it in place.
+# Each entry points back to the latest keyframe of its video stream and the latest
+# HELLO, which is all a seek needs to start decoding from any record, and to the
+# latest CHAT record, so the chat a seek skips over is found without a scan.
+INDEX_MAGIC = b"VIRNIDX2"
+INDEX_SUFFIX = ".idx"
+INDEX_ENTRY = struct.Struct("!QQIIIBBH")
+# Keyframe / HELLO / CHAT reference of a record that has none before it
+NO_ENTRY = 0xFFFFFFFF
+
+IndexEntry = collections.namedtuple("IndexEntry", "time_us offset keyframe hello chat type flags stream_id")
+
+# Where recordings go unless VIRN_RECORDINGS_DIR says otherwise
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".virn", "recordings")
+
+# Messages waiting for the writer thread. When the disk can't keep up, further
+# messages are dropped (and counted) rather than blocking the call.
+RECORD_QUEUE_SIZE = 1024
+# Records gathered into one write() call
+WRITE_BATCH_BYTES = 256 * 1024
+
+def new_recording_path(directory=None):
+    """
+    A fresh, timestamped file name in directory (default: VIRN_RECORDINGS_DIR or DEFAULT_DIR).
+    """
+    directory = directory or os.environ.get("VIRN_RECORDINGS_DIR") or DEFAULT_DIR
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, time.strftime("call-%Y%m%d-%H%M%S") + RECORDING_EXTENSION)
+
+class Indexer:
+    """
+    Builds index entries record by record, tracking each stream's latest keyframe.
+    """
+    def __init__(self):
+        self.count = 0
+        self.keyframes = {}
+        self.hello = NO_ENTRY
+        self.chat = NO_ENTRY
+
+    def add(self, offset, time_us, message):
+        """
+        Index entry (bytes) for the record at offset holding message.
+        """
+        header = protocol.unpack(message)
+        index = self.count
+        self.count += 1
+        if header.type == protocol.HELLO:
+            self.hello = index
+        elif header.type == protocol.CHAT:
+            self.chat = index
+        keyframe = index
+        if header.type == protocol.VIDEO:
+            if header.flags & protocol.FLAG_KEYFRAME:
+                self.keyframes[header.stream_id] = index
+            keyframe = self.keyframes.get(header.stream_id, NO_ENTRY)
+        return INDEX_ENTRY.pack(time_us, offset, keyframe, self.hello, self.chat,
+                                header.type, header.flags, header.stream_id)
+
+def build_index(path):
+    """
+    (Re)builds path's index by reading the recording once, e.g. after a crash
+    left it incomplete. Stops at a truncated last record.
+    """
+    indexer = Indexer()
+    with open(path, "rb") as data, open(path + INDEX_SUFFIX, "wb") as index:
+        if data.read(len(RECORDING_MAGIC)) != RECORDING_MAGIC:
+            raise ValueError(f"{path} is not a recording")
+        index.write(INDEX_MAGIC)
+        offset = len(RECORDING_MAGIC)
+        while True:
+            header = data.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            length, time_us = RECORD_HEADER.unpack(header)
+            message = data.read(length)
+            if len(message) < length:
+                break
+            index.write(indexer.add(offset, time_us, message))
+            offset += RECORD_HEADER.size + length
+
+class Recorder:
+    """
+    Appends already-encoded protocol messages to a recording file. write() only
+    queues (it never blocks the caller); a writer thread drains the queue and
+    writes whatever has piled up in one go, along with its index entries.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(RECORDING_MAGIC)
+        self.index_file = open(path + INDEX_SUFFIX, "wb")
+        self.index_file.write(INDEX_MAGIC)
+        self.indexer = Indexer()
+        self.started = time.monotonic()
+        self.queue = queue.Queue(maxsize=RECORD_QUEUE_SIZE)
+        self.messages_dropped = 0
+        self.bytes_written = len(RECORDING_MAGIC)
+        self.writer_thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer_thread.start()
+
+    def write(self, message):
+        """
+        Queues one packed protocol message (bytes). Safe from any thread.
+        """
+        try:
+            self.queue.put_nowait((time.monotonic(), message))
+        except queue.Full:
+            self.messages_dropped += 1
+
+    def _write_loop(self):
+        running = True
+        while running:
+            chunks = []
+            entries = []
+            size = 0
+            item = self.queue.get()
+            while True:
+                if item is None:
+                    running = False
+                    break
+                recorded_at, message = item
+                offset_us = int((recorded_at - self.started) * 1_000_000)
+                chunks.append(RECORD_HEADER.pack(len(message), offset_us))
+                chunks.append(message)
+                entries.append(self.indexer.add(self.bytes_written + size, offset_us, message))
+                size += RECORD_HEADER.size + len(message)
+                if size >= WRITE_BATCH_BYTES:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if not chunks:
+                continue
+            try:
+                self.file.write(b"".join(chunks))
+                self.index_file.write(b"".join(entries))
+                self.bytes_written += size
+            except OSError as e:
+                print(f"Recording write error: {e}")
+                running = False
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "bytes": self.bytes_written,
+            "queued": self.queue.qsize(),
+            "dropped": self.messages_dropped,
+        }
+
+    def close(self):
+        """
+        Writes out everything still queued and closes the file.
+        """
+        if self.writer_thread.is_alive():
+            # Blocks only if the queue is full, i.e. until the writer catches up
+            self.queue.put(None)
+            self.writer_thread.join()
+        self.file.close()
+        self.index_file.close()
+
+class Recording:
+    """
+    Read-only view of a recording for playback. The recording and its index are
+    memory-mapped, so opening one is instant whatever its length, and only the
+    pages a player touches are ever read.
+    """
+    def __init__(self, path):
+        self.path = path
+        index_path = path + INDEX_SUFFIX
+        if not os.path.exists(index_path) or not self._index_complete(path, index_path):
+            build_index(path)
+        with open(path, "rb") as data:
+            self.data = mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(RECORDING_MAGIC)] != RECORDING_MAGIC:
+            self.data.close()
+            raise ValueError(f"{path} is not a recording")
+        with open(index_path, "rb") as index:
+            self.index = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = (len(self.index) - len(INDEX_MAGIC)) // INDEX_ENTRY.size
+        self.duration_us = self.entry(self.count - 1).time_us if self.count else 0
+
+    @staticmethod
+    def _index_complete(path, index_path):
+        # Same index format, and the last entry must end exactly where the recording does
+        with open(index_path, "rb") as index:
+            if index.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                return False
+        size = os.path.getsize(index_path)
+        if size < len(INDEX_MAGIC) + INDEX_ENTRY.size:
+            return os.path.getsize(path) <= len(RECORDING_MAGIC)
+        with open(index_path, "rb") as index:
+            index.seek(size - (size - len(INDEX_MAGIC)) % INDEX_ENTRY.size - INDEX_ENTRY.size)
+            last = IndexEntry(*INDEX_ENTRY.unpack(index.read(INDEX_ENTRY.size)))
+        with open(path, "rb") as data:
+            data.seek(last.offset)
+            header = data.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return False
+        length, _ = RECORD_HEADER.unpack(header)
+        return last.offset + RECORD_HEADER.size + length == os.path.getsize(path)
+
+    def __len__(self):
+        return self.count
+
+    def entry(self, i):
+        return IndexEntry(*INDEX_ENTRY.unpack_from(self.index, len(INDEX_MAGIC) + i * INDEX_ENTRY.size))
+
+    def find(self, time_us):
+        """
+        First record at or after time_us (len(self) past the end), by binary search.
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.entry(middle).time_us < time_us:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def chat_between(self, start, end):
+        """
+        Indices of the CHAT records in [start, end), oldest first. Follows the index's
+        back-references, so the cost is one lookup per chat record, not per record.
+        """
+        found = []
+        i = self.entry(end - 1).chat if end > start else NO_ENTRY
+        while i != NO_ENTRY and i >= start:
+            found.append(i)
+            i = self.entry(i - 1).chat if i > 0 else NO_ENTRY
+        found.reverse()
+        return found
+
+    def message(self, i):
+        """
+        Record i as a protocol.Message. Its payload is copied out of the map, so it
+        outlives the Recording.
+        """
+        offset = self.entry(i).offset
+        length, _ = RECORD_HEADER.unpack_from(self.data, offset)
+        start = offset + RECORD_HEADER.size
+        return protocol.unpack(self.data[start:start + length])
+
+    def close(self):
+        self.data.close()
+        self.index.close()
@@ -7,7 +7,7 @@ from user_profile import UserProfile
 from profile_widget import ProfileWidget
 
 class ModeSelectionWidget(QWidget):
-    mode_selected = pyqtSignal(str) # Emits "HOST" or "CLIENT"
+    mode_selected = pyqtSignal(str) # Emits "HOST", "CLIENT" or "PLAYBACK"
 
     def __init__(self):
         super().__init__()
@@ -85,6 +85,21 @@ class ModeSelectionWidget(QWidget):
 
         layout.addLayout(cards_layout)
 
+        # Recorded calls are played back in the call view
+        self.btn_playback = QPushButton("▶  Watch a recording")
+        self.btn_playback.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.btn_playback.setStyleSheet("""
+            QPushButton {
+                color: #9ca3af;
+                background: transparent;
+                border: none;
+                font-size: 15px;
+            }
+            QPushButton:hover { color: white; }
+        """)
+        self.btn_playback.clicked.connect(lambda: self.mode_selected.emit("PLAYBACK"))
+        layout.addWidget(self.btn_playback, alignment=Qt.AlignmentFlag.AlignCenter)
+
     def create_card(self, badge_text, title_text, desc_text, accent_color, mode_key):
         container = QWidget()
         container.setFixedSize(320, 420)
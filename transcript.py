@@ -0,0 +1,205 @@
+import collections
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+# Where transcripts are kept unless VIRN_TRANSCRIPT_DB says otherwise
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".virn", "transcripts.db")
+# Most messages written in one transaction; whatever is queued goes in together
+WRITE_BATCH = 500
+# Results returned by one search
+SEARCH_LIMIT = 100
+
+SearchResult = collections.namedtuple("SearchResult", "meeting_title meeting_started time is_me text snippet")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meetings (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    started REAL NOT NULL,
+    title TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    meeting INTEGER NOT NULL REFERENCES meetings(id),
+    time REAL NOT NULL,
+    is_me INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_meeting ON messages(meeting, id);
+"""
+
+# Full-text index over messages.text, kept in step by a trigger (the store is append-only)
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(text, content='messages', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+def _connect(path):
+    connection = sqlite3.connect(path)
+    # WAL lets searches read while the writer thread appends
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+def _match_query(text):
+    """
+    Turns what the user typed into an FTS5 query: every word must appear, the last as a prefix.
+    """
+    words = [word.replace('"', '""') for word in text.split()]
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+class TranscriptStore:
+    """
+    Append-only chat transcripts of every meeting in a local SQLite database, with
+    a full-text index for searching across meetings.
+    add() only queues; a writer thread commits whatever is queued in one
+    transaction, so the GUI thread never waits on the disk.
+    """
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("VIRN_TRANSCRIPT_DB") or DEFAULT_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Create the schema up front so a broken database fails here, not on the writer thread
+        connection = _connect(self.path)
+        with connection:
+            connection.executescript(SCHEMA)
+            try:
+                connection.executescript(FTS_SCHEMA)
+                self.indexed = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5: search falls back to a scan
+                print("SQLite has no FTS5; transcript search will be slow")
+                self.indexed = False
+        connection.close()
+
+        self.queue = queue.Queue()
+        self._reader = None
+        self.writer_thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer_thread.start()
+
+    def start_meeting(self, title=""):
+        """
+        Registers a meeting and returns its key, for add().
+        """
+        key = uuid.uuid4().hex
+        self.queue.put(("meeting", key, time.time(), title))
+        return key
+
+    def add(self, meeting, texts, is_me=False, when=None):
+        """
+        Queues messages of meeting for writing, oldest first.
+        """
+        if texts:
+            self.queue.put(("messages", meeting, when or time.time(), is_me, list(texts)))
+
+    def flush(self):
+        """
+        Waits until everything queued so far is committed.
+        """
+        self.queue.join()
+
+    def _write_loop(self):
+        connection = _connect(self.path)
+        meeting_ids = {}
+        running = True
+        while running:
+            items = [self.queue.get()]
+            # Take whatever else has piled up meanwhile, up to WRITE_BATCH messages
+            # or the shutdown sentinel, whichever comes first
+            count = 0
+            while items[-1] is not None and count < WRITE_BATCH:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                items.append(item)
+                if item is not None and item[0] == "messages":
+                    count += len(item[4])
+            try:
+                with connection:
+                    for item in items:
+                        if item is None:
+                            running = False
+                        elif item[0] == "meeting":
+                            _, key, started, title = item
+                            cursor = connection.execute(
+                                "INSERT INTO meetings (key, started, title) VALUES (?, ?, ?)",
+                                (key, started, title))
+                            meeting_ids[key] = cursor.lastrowid
+                        else:
+                            _, key, when, is_me, texts = item
+                            meeting_id = meeting_ids.get(key)
+                            if meeting_id is None:
+                                continue
+                            connection.executemany(
+                                "INSERT INTO messages (meeting, time, is_me, text) VALUES (?, ?, ?, ?)",
+                                [(meeting_id, when, int(is_me), text) for text in texts])
+            except sqlite3.Error as e:
+                print(f"Transcript write error: {e}")
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+        connection.close()
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        """
+        Messages from any meeting matching all words of text, newest first.
+        """
+        if self._reader is None:
+            self._reader = _connect(self.path)
+        if self.indexed:
+            query = _match_query(text)
+            if query is None:
+                return []
+            sql = """
+                SELECT meetings.title, meetings.started, messages.time, messages.is_me, messages.text,
+                       snippet(messages_fts, 0, '[', ']', '…', 12)
+                FROM messages_fts
+                JOIN messages ON messages.id = messages_fts.rowid
+                JOIN meetings ON meetings.id = messages.meeting
+                WHERE messages_fts MATCH ?
+                ORDER BY messages_fts.rowid DESC
+                LIMIT ?
+            """
+            params = (query, limit)
+        else:
+            words = text.split()
+            if not words:
+                return []
+            sql = f"""
+                SELECT meetings.title, meetings.started, messages.time, messages.is_me, messages.text,
+                       messages.text
+                FROM messages
+                JOIN meetings ON meetings.id = messages.meeting
+                WHERE {" AND ".join("messages.text LIKE ?" for _ in words)}
+                ORDER BY messages.id DESC
+                LIMIT ?
+            """
+            params = tuple(f"%{word}%" for word in words) + (limit,)
+        try:
+            rows = self._reader.execute(sql, params).fetchall()
+        except sqlite3.OperationalError as e:
+            print(f"Transcript search error: {e}")
+            return []
+        return [SearchResult(title, started, when, bool(is_me), message, snippet)
+                for title, started, when, is_me, message, snippet in rows]
+
+    def close(self):
+        """
+        Writes out what is still queued and stops the writer thread.
+        """
+        if self.writer_thread.is_alive():
+            self.queue.put(None)
+            self.writer_thread.join()
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
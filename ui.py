@@ -1,21 +1,27 @@
+import math
+import os
 import sys
-import cv2
-from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, 
+import time
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QGridLayout,
                              QLabel, QLineEdit, QPushButton, QMessageBox, QFrame,
-                             QSizePolicy, QStackedLayout)
-from PyQt6.QtCore import Qt, QTimer, pyqtSignal
-from PyQt6.QtGui import QImage, QPixmap
+                             QSizePolicy, QStackedLayout, QSlider)
+from PyQt6.QtCore import Qt, QTimer, QEvent, pyqtSignal
 from user_profile import UserProfile
 
+import audio
 import video
+from video_widget import VideoWidget
 import network
+import playback
+import transcript
 from chat_widget import ChatWidget
 
 class VideoCallWidget(QWidget):
     call_ended = pyqtSignal()
 
-    def __init__(self, mode="HOST"):
+    def __init__(self, mode="HOST", recording=None):
         super().__init__()
+        # "HOST", "CLIENT", or "PLAYBACK" to watch the recording at path `recording`
         self.mode = mode 
         
         # UI State
@@ -23,26 +29,71 @@ class VideoCallWidget(QWidget):
         self.is_camera_on = True
         self.is_cc_on = False
         self.mom_enabled = False # Track if MOM was toggled ON
-        
-        # Initialize core components
-        try:
-            self.camera = video.VideoCamera()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Could not access camera: {e}")
-            self.camera = None 
-            
-        self.connection_manager = network.ConnectionManager()
-        if self.camera:
-            self.connection_manager.set_camera(self.camera)
+
+        # Remote participants, by stream id: tile frame and its video label
+        self.remote_tiles = {}
+        self.remote_video_views = {}
+        self._views_pending = False
+        
+        # Initialize core components, with this call's capture settings
+        profile = UserProfile()
+        width, height = profile.video_resolution
+        self.camera = None
+        self.audio_capture = None
+        self.transcript = None
+        self.meeting = None
+        if self.mode == "PLAYBACK":
+            # Plays the recording through the same signals as a live call
+            self.connection_manager = playback.RecordingPlayer(recording)
+        else:
+            try:
+                # VIRN_VIDEO_SOURCE swaps the webcam for a file, image sequence or "test:<pattern>"
+                source = os.environ.get("VIRN_VIDEO_SOURCE", 0)
+                self.camera = video.VideoCamera(source, width=width, height=height, fps=profile.video_fps)
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"Could not access camera: {e}")
+                self.camera = None 
+                
+            self.connection_manager = network.ConnectionManager(fps=profile.video_fps)
+            if self.camera:
+                self.connection_manager.set_camera(self.camera)
+
+            # Audio: VIRN_AUDIO_SOURCE can be "sine" or a WAV path, VIRN_AUDIO_SINK "null"
+            # or a WAV path, to run calls without sound hardware
+            try:
+                self.audio_capture = audio.AudioCapture(audio.open_source(os.environ.get("VIRN_AUDIO_SOURCE")))
+            except Exception as e:
+                print(f"Could not access microphone: {e}")
+                self.audio_capture = None
+
+            # This meeting's chat is kept in the local transcript store (VIRN_TRANSCRIPT_DB)
+            try:
+                self.transcript = transcript.TranscriptStore()
+                self.meeting = self.transcript.start_meeting(
+                    f"{self.mode.title()} call {time.strftime('%Y-%m-%d %H:%M')}")
+            except Exception as e:
+                print(f"Could not open chat transcripts: {e}")
+                self.transcript = None
+                self.meeting = None
+        self.audio_player = audio.AudioPlayer(audio.open_sink(os.environ.get("VIRN_AUDIO_SINK")))
+        self.connection_manager.set_audio(self.audio_capture, self.audio_player)
 
         self.init_ui()
+        self.chat_widget.set_transcript(self.transcript)
+        if self.mode == "PLAYBACK":
+            self.chat_widget.msg_input.setReadOnly(True)
+            self.chat_widget.msg_input.setPlaceholderText("Recorded chat is read-only")
         
         # Signals
         self.connection_manager.connected.connect(self.on_connected)
         self.connection_manager.disconnected.connect(self.on_disconnected)
         self.connection_manager.error.connect(self.on_error)
         self.connection_manager.new_frame_received.connect(self.update_remote_frame)
-        self.connection_manager.chat_message_received.connect(self.on_chat_received)
+        self.connection_manager.chat_messages_received.connect(self.on_chat_received)
+        self.connection_manager.stats_updated.connect(self.on_stats_updated)
+        self.connection_manager.participant_joined.connect(self.add_remote_tile)
+        self.connection_manager.participant_left.connect(self.remove_remote_tile)
+        self.connection_manager.participant_video_muted.connect(self.on_participant_video_muted)
 
         # Timer for local video preview
         self.timer = QTimer()
@@ -52,6 +103,9 @@ class VideoCallWidget(QWidget):
         # Auto-start hosting if in host mode
         if self.mode == "HOST":
             QTimer.singleShot(500, self.start_host)
+        elif self.mode == "PLAYBACK":
+            self.connection_manager.position_changed.connect(self.on_playback_position)
+            QTimer.singleShot(0, self.connection_manager.start)
 
         # Captions State
         self.captions_lines = [line for line in UserProfile().captions_text.split('\n') if line.strip()]
@@ -80,24 +134,36 @@ class VideoCallWidget(QWidget):
         video_main_layout = QVBoxLayout(video_area)
         video_main_layout.setContentsMargins(0,0,0,0)
         
-        # The HBox for video feeds
-        video_layout = QHBoxLayout()
-        video_layout.setContentsMargins(20, 20, 20, 20)
-        video_layout.setSpacing(20)
+        # The grid for video feeds: local tile first, then one tile per participant
+        self.video_grid = QGridLayout()
+        self.video_grid.setContentsMargins(20, 20, 20, 20)
+        self.video_grid.setSpacing(20)
 
         # Local Video
         self.local_container = self.create_video_frame("You")
-        self.local_video_label = self.local_container.findChild(QLabel, "video_label")
-        
-        # Remote Video
-        self.remote_container = self.create_video_frame("Team Member")
-        self.remote_video_label = self.remote_container.findChild(QLabel, "video_label")
+        self.local_video_view = self.local_container.findChild(VideoWidget, "video_view")
+        # The capture thread prepares preview frames at this tile's size
+        self.local_video_view.installEventFilter(self)
+        self.layout_video_grid()
+
+        # Stats Overlay (top-left, toggled from the control bar)
+        self.stats_label = QLabel("")
+        self.stats_label.setSizePolicy(QSizePolicy.Policy.Maximum, QSizePolicy.Policy.Maximum)
+        self.stats_label.setStyleSheet("""
+            QLabel {
+                background-color: rgba(0, 0, 0, 0.6);
+                color: #8ab4f8;
+                font-family: monospace;
+                font-size: 12px;
+                padding: 6px 10px;
+                border-radius: 4px;
+                margin: 10px 0 0 20px;
+            }
+        """)
+        self.stats_label.hide()
+        video_main_layout.addWidget(self.stats_label)
 
-        video_layout.addWidget(self.local_container)
-        video_layout.addWidget(self.remote_container)
-        self.remote_container.setVisible(False)
-        
-        video_main_layout.addLayout(video_layout)
+        video_main_layout.addLayout(self.video_grid)
         
         # Captions Label (Overlay style)
         self.caption_label = QLabel("")
@@ -200,6 +266,31 @@ class VideoCallWidget(QWidget):
         self.btn_chat = self.create_control_btn("🗨", "Chat")
         self.btn_chat.clicked.connect(self.toggle_chat)
 
+        self.btn_stats = self.create_control_btn("📊", "Call Stats")
+        self.btn_stats.clicked.connect(self.toggle_stats)
+
+        self.btn_record = self.create_control_btn("⏺", "Record")
+        self.btn_record.clicked.connect(self.toggle_recording)
+
+        if self.mode == "PLAYBACK":
+            # Nothing of ours goes out: the call controls give way to transport controls
+            for btn in (self.btn_mic, self.btn_cam, self.btn_cc, self.btn_record, self.btn_stats):
+                btn.setVisible(False)
+            self.btn_play = self.create_control_btn("⏸", "Pause")
+            self.btn_play.clicked.connect(self.toggle_playback)
+            layout.addWidget(self.btn_play)
+            self.playback_slider = QSlider(Qt.Orientation.Horizontal)
+            self.playback_slider.setMinimumWidth(300)
+            # Counts milliseconds: arrow keys step 1 s, clicks on the track 10 s
+            self.playback_slider.setSingleStep(1000)
+            self.playback_slider.setPageStep(10000)
+            self.playback_slider.sliderReleased.connect(self.seek_playback)
+            self.playback_slider.actionTriggered.connect(self.on_playback_slider_action)
+            layout.addWidget(self.playback_slider)
+            self.lbl_playback = QLabel("0:00 / 0:00")
+            self.lbl_playback.setStyleSheet("color: #aaa;")
+            layout.addWidget(self.lbl_playback)
+
         if self.mode == "HOST":
             self.btn_mom = self.create_control_btn("📝", "Minutes of Meeting")
             self.btn_mom.clicked.connect(self.toggle_mom)
@@ -224,6 +315,8 @@ class VideoCallWidget(QWidget):
         layout.addWidget(self.btn_cam)
         layout.addWidget(self.btn_cc)
         layout.addWidget(self.btn_chat)
+        layout.addWidget(self.btn_stats)
+        layout.addWidget(self.btn_record)
         layout.addWidget(self.btn_leave)
         
         layout.addStretch()
@@ -254,6 +347,8 @@ class VideoCallWidget(QWidget):
 
     def toggle_mic(self):
         self.is_mic_on = not self.is_mic_on
+        if self.audio_capture:
+            self.audio_capture.muted = not self.is_mic_on
         if self.is_mic_on:
             self.btn_mic.setStyleSheet(self.btn_mic.styleSheet().replace("background-color: #ea4335;", "background-color: #3c4043;"))
             self.btn_mic.setText("🎤")
@@ -261,19 +356,73 @@ class VideoCallWidget(QWidget):
             self.btn_mic.setStyleSheet(self.btn_mic.styleSheet().replace("background-color: #3c4043;", "background-color: #ea4335;"))
             self.btn_mic.setText("🚫") # Muted icon
 
+    def toggle_recording(self):
+        """
+        Records the call as it is sent and received (see recording.py) to VIRN_RECORDINGS_DIR.
+        """
+        if self.connection_manager.recorder is None:
+            try:
+                path = self.connection_manager.start_recording()
+            except OSError as e:
+                QMessageBox.warning(self, "Recording", f"Could not start recording: {e}")
+                return
+            self.btn_record.setStyleSheet(self.btn_record.styleSheet().replace("background-color: #3c4043;", "background-color: #ea4335;"))
+            self.btn_record.setToolTip(f"Stop recording ({path})")
+        else:
+            self.stop_recording()
+
+    def stop_recording(self):
+        stats = self.connection_manager.stop_recording()
+        self.btn_record.setStyleSheet(self.btn_record.styleSheet().replace("background-color: #ea4335;", "background-color: #3c4043;"))
+        self.btn_record.setToolTip("Record")
+        if stats:
+            print(f"Recording saved to {stats['path']} ({stats['bytes'] // 1024} KB, {stats['dropped']} messages dropped)")
+
+    def toggle_playback(self):
+        player = self.connection_manager
+        if player.paused:
+            player.resume()
+            self.btn_play.setText("⏸")
+            self.btn_play.setToolTip("Pause")
+        else:
+            player.pause()
+            self.btn_play.setText("▶")
+            self.btn_play.setToolTip("Play")
+
+    def seek_playback(self):
+        # The slider counts milliseconds
+        self.connection_manager.seek(self.playback_slider.value() * 1000)
+
+    def on_playback_slider_action(self, action):
+        # Drags seek once, on release; clicks and keys seek right away
+        if action != QSlider.SliderAction.SliderMove:
+            self.connection_manager.seek(self.playback_slider.sliderPosition() * 1000)
+
+    def on_playback_position(self, position_us, duration_us):
+        def clock(us):
+            seconds = us // 1_000_000
+            return f"{seconds // 60}:{seconds % 60:02d}"
+        self.lbl_playback.setText(f"{clock(position_us)} / {clock(duration_us)}")
+        if not self.playback_slider.isSliderDown():
+            self.playback_slider.setMaximum(duration_us // 1000)
+            self.playback_slider.setValue(position_us // 1000)
+
     def toggle_cam(self):
         self.is_camera_on = not self.is_camera_on
         if self.is_camera_on:
             self.btn_cam.setStyleSheet(self.btn_cam.styleSheet().replace("background-color: #ea4335;", "background-color: #3c4043;"))
             self.btn_cam.setText("📹")
-            self.local_video_label.setVisible(True)
+            self.local_video_view.setVisible(True)
+            if self.camera:
+                self.camera.resume()
         else:
             self.btn_cam.setStyleSheet(self.btn_cam.styleSheet().replace("background-color: #3c4043;", "background-color: #ea4335;"))
             self.btn_cam.setText("🚫")
-            self.local_video_label.setVisible(False) 
-            # Note: We should technically stop sending frames, 
-            # but setting visible(False) effectively stops update_local_frame from processing (visuals only)
-            # To stop sending: handled in get_frame logic check
+            self.local_video_view.setVisible(False) 
+            # Release the device and stop encoding; peers are told to stop decoding
+            if self.camera:
+                self.camera.pause()
+        self.connection_manager.set_video_muted(not self.is_camera_on)
 
     def toggle_cc(self):
         self.is_cc_on = not self.is_cc_on
@@ -281,7 +430,7 @@ class VideoCallWidget(QWidget):
             self.btn_cc.setStyleSheet(self.btn_cc.styleSheet().replace("background-color: #3c4043;", "background-color: #8ab4f8;").replace("color: white;", "color: black;"))
             
             # Start captions if we have a peer (simulated check)
-            if self.remote_container.isVisible():
+            if self.remote_tiles:
                  self.start_captions()
             else:
                  QMessageBox.information(self, "Captions", "Captions will start when a participant joins.")
@@ -329,13 +478,56 @@ class VideoCallWidget(QWidget):
             self.chat_widget.show()
             self.btn_chat.setStyleSheet(self.btn_chat.styleSheet().replace("background-color: #3c4043;", "background-color: #8ab4f8;").replace("color: white;", "color: black;"))
 
+    def toggle_stats(self):
+        if self.stats_label.isVisible():
+            self.stats_label.hide()
+            self.btn_stats.setStyleSheet(self.btn_stats.styleSheet().replace("background-color: #8ab4f8;", "background-color: #3c4043;").replace("color: black;", "color: white;"))
+        else:
+            self.stats_label.setText("Waiting for call stats...")
+            self.stats_label.show()
+            self.btn_stats.setStyleSheet(self.btn_stats.styleSheet().replace("background-color: #3c4043;", "background-color: #8ab4f8;").replace("color: white;", "color: black;"))
+
+    def on_stats_updated(self, stats):
+        if not self.stats_label.isVisible():
+            return
+
+        def ms(stage):
+            timing = stats.get(f"{stage}_ms")
+            return f"{timing['p50']:.0f}" if timing else "-"
+
+        rtt = f"{stats['rtt_ms']:.0f}" if stats.get("rtt_ms") is not None else "-"
+        dropped = stats["dropped"]
+        profile = stats["profile"]
+        self.stats_label.setText(
+            f"Out  {stats['fps_out']:4.1f} fps  {stats['kbps_out']:6.0f} kbps  "
+            f"{profile['width']}x{profile['height']} q{profile['quality']} ({stats['codecs']['send']})\n"
+            f"In   {stats['fps_in']:4.1f} fps  {stats['kbps_in']:6.0f} kbps  ({stats['codecs']['recv']})\n"
+            f"RTT {rtt} ms  encode {ms('encode')}  decode {ms('decode')}  e2e {ms('end_to_end')} ms\n"
+            f"Dropped {dropped['send_queue']}  stale {dropped['stale']}  lost {dropped['lost']}"
+        )
+        sound = stats.get("audio")
+        if sound and stats["codecs"].get("audio"):
+            self.stats_label.setText(self.stats_label.text() +
+                f"\nAudio ({stats['codecs']['audio']})  buffer {sound['delay_ms']} ms  "
+                f"jitter {sound['jitter_ms']:.0f} ms  concealed {sound['concealed']}  "
+                f"A/V skew {ms('av_skew')} ms")
+        recorder = stats.get("recording")
+        if recorder:
+            self.stats_label.setText(self.stats_label.text() +
+                f"\nRecording {recorder['bytes'] / 1048576:.1f} MB  "
+                f"queued {recorder['queued']}  dropped {recorder['dropped']}")
+
     def send_chat(self, text):
         self.connection_manager.send_chat_message(text)
+        if self.transcript:
+            self.transcript.add(self.meeting, [text], is_me=True)
 
-    def on_chat_received(self, text):
+    def on_chat_received(self, texts):
         if not self.chat_widget.isVisible():
             self.toggle_chat() # Auto open chat
-        self.chat_widget.add_message(text, is_me=False)
+        self.chat_widget.add_messages(texts, is_me=False)
+        if self.transcript:
+            self.transcript.add(self.meeting, texts)
 
     def create_video_frame(self, label_text):
         frame = QFrame()
@@ -350,11 +542,8 @@ class VideoCallWidget(QWidget):
         layout.setContentsMargins(0,0,0,0)
         
         # Video Area
-        vid_label = QLabel()
-        vid_label.setObjectName("video_label")
-        vid_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        vid_label.setStyleSheet("background-color: black; border-radius: 12px;")
-        vid_label.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
+        vid_view = VideoWidget()
+        vid_view.setObjectName("video_view")
         
         # Bottom Name Tag
         name_bar = QFrame()
@@ -375,40 +564,113 @@ class VideoCallWidget(QWidget):
         nb_layout.addWidget(name_tag)
         nb_layout.addStretch()
 
-        layout.addWidget(vid_label)
+        layout.addWidget(vid_view)
         layout.addWidget(name_bar) 
         
         return frame
 
+    def add_remote_tile(self, stream_id):
+        if stream_id in self.remote_tiles:
+            return
+        name = "Host" if stream_id == 0 else f"Participant {stream_id}"
+        tile = self.create_video_frame(name)
+        view = tile.findChild(VideoWidget, "video_view")
+        # Tile resizes change the decode size the stream needs
+        view.installEventFilter(self)
+        view.frame_painted.connect(self.connection_manager.frame_rendered)
+        self.remote_tiles[stream_id] = tile
+        self.remote_video_views[stream_id] = view
+        self.layout_video_grid()
+
+    def on_participant_video_muted(self, stream_id, muted):
+        view = self.remote_video_views.get(stream_id)
+        if view is None:
+            return
+        if muted:
+            view.clear("Camera off")
+        else:
+            view.clear()
+
+    def remove_remote_tile(self, stream_id):
+        tile = self.remote_tiles.pop(stream_id, None)
+        self.remote_video_views.pop(stream_id, None)
+        if tile is None:
+            return
+        self.video_grid.removeWidget(tile)
+        tile.deleteLater()
+        self.layout_video_grid()
+
+    def layout_video_grid(self):
+        """
+        Arranges all tiles in a near-square grid (1x1, 2x1, 2x2, 3x3, ...).
+        """
+        tiles = list(self.remote_tiles.values())
+        # A recording has no local camera: only the recorded participants are shown
+        if self.mode != "PLAYBACK":
+            tiles.insert(0, self.local_container)
+        for tile in tiles:
+            self.video_grid.removeWidget(tile)
+        columns = math.ceil(math.sqrt(len(tiles)))
+        for i, tile in enumerate(tiles):
+            self.video_grid.addWidget(tile, i // columns, i % columns)
+        self.schedule_stream_views()
+
+    def schedule_stream_views(self):
+        # Coalesce bursts of resizes into a single update
+        if not self._views_pending:
+            self._views_pending = True
+            QTimer.singleShot(0, self.update_stream_views)
+
+    def update_stream_views(self):
+        """
+        Reports each remote tile's on-screen size to the decoder: small tiles get
+        reduced-resolution decodes, hidden tiles or a minimized window pause decoding.
+        The local tile's size sets the camera's preview size.
+        """
+        self._views_pending = False
+        if self.camera:
+            self.camera.set_preview_size(self.local_video_view.width(), self.local_video_view.height())
+        hidden = not self.isVisible() or self.window().isMinimized()
+        for stream_id, view in self.remote_video_views.items():
+            if hidden or not view.isVisible():
+                self.connection_manager.set_stream_view(stream_id, 0, 0)
+            else:
+                self.connection_manager.set_stream_view(stream_id, view.width(), view.height())
+
+    def eventFilter(self, obj, event):
+        if event.type() in (QEvent.Type.Resize, QEvent.Type.WindowStateChange):
+            self.schedule_stream_views()
+        return super().eventFilter(obj, event)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        # Minimizing only notifies the top-level window, so watch it for state changes
+        self.window().installEventFilter(self)
+        self.schedule_stream_views()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.schedule_stream_views()
+
     def update_local_frame(self):
         if not self.is_camera_on:
              return
-        if not self.local_video_label.isVisible():
+        if not self.local_video_view.isVisible() or self.window().isMinimized():
              return
 
         if self.camera:
-            frame = self.camera.get_frame()
+            frame = self.camera.get_preview()
             if frame is not None:
-                height, width, channel = frame.shape
-                bytes_per_line = 3 * width
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                q_img = QImage(rgb_frame.data, width, height, bytes_per_line, QImage.Format.Format_RGB888).copy()
-                
-                w = self.local_video_label.width()
-                h = self.local_video_label.height()
-                if w < 10 or h < 10: return
-                
-                self.local_video_label.setPixmap(QPixmap.fromImage(q_img).scaled(w, h, Qt.AspectRatioMode.KeepAspectRatio))
+                # Views the capture buffer directly; the ring keeps the slot intact
+                # for several more captures, well past the next repaint
+                self.local_video_view.set_frame(video.VideoFrame(frame))
 
-    def update_remote_frame(self, q_img):
-        if not self.remote_container.isVisible():
+    def update_remote_frame(self, video_frame):
+        view = self.remote_video_views.get(video_frame.stream_id)
+        if view is None or not view.isVisible():
             return
-            
-        w = self.remote_video_label.width()
-        h = self.remote_video_label.height()
-        if w < 10 or h < 10: return
-
-        self.remote_video_label.setPixmap(QPixmap.fromImage(q_img).scaled(w, h, Qt.AspectRatioMode.KeepAspectRatio))
+        # Render metrics are recorded when the frame is actually painted
+        view.set_frame(video_frame)
 
     def start_host(self):
         port = 8000
@@ -442,6 +704,7 @@ class VideoCallWidget(QWidget):
         # Stop everything first
         self.connection_manager.stop_connection()
         self.timer.stop()
+        self.stop_recording()
         
         # Check MOM
         if self.mom_enabled:
@@ -455,7 +718,6 @@ class VideoCallWidget(QWidget):
         self.call_ended.emit()
 
     def on_connected(self):
-        self.remote_container.setVisible(True)
         if self.mode == "CLIENT":
             self.top_connection_bar.setVisible(False) # Hide input when connected
 
@@ -464,9 +726,7 @@ class VideoCallWidget(QWidget):
             self.start_captions()
 
     def on_disconnected(self):
-        self.remote_video_label.clear()
-        self.remote_container.setVisible(False)
-        
+        # Tiles go away with participant_left, which the manager emits for every stream it drops
         if self.mode == "CLIENT":
             self.btn_connect.setText("Join")
             self.btn_connect.setEnabled(True)
@@ -484,8 +744,20 @@ class VideoCallWidget(QWidget):
             if self.timer.isActive():
                 self.timer.stop()
             self.connection_manager.stop_connection()
+            self.connection_manager.stop_recording()
             if self.camera:
                 self.camera.release()
                 self.camera = None # Prevent double release
+            if self.audio_capture:
+                self.audio_capture.release()
+                self.audio_capture = None
+            if self.audio_player:
+                self.audio_player.release()
+                self.audio_player = None
+            if self.transcript:
+                self.transcript.close()
+                self.transcript = None
+            # Deletes the chat history spill file now rather than at garbage collection
+            self.chat_widget.model.close()
         except Exception as e:
             print(f"Error during cleanup: {e}")
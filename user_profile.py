@@ -14,6 +14,9 @@ Post-Quantum cryptography keeps it safe.
 Video conferencing is the future.
 VIRN is awesome.
 """
+            # Capture settings for the next call
+            cls._instance.video_resolution = (640, 480)
+            cls._instance.video_fps = 15
             cls._instance.mom_text = """Meeting Minutes
 Date: Today
 Topic: Project Sync
@@ -32,6 +35,10 @@ Action Items:
     def get_initials(self):
         return self.initials
 
-    def update_settings(self, captions, mom):
+    def update_settings(self, captions, mom, resolution=None, fps=None):
         self.captions_text = captions
         self.mom_text = mom
+        if resolution:
+            self.video_resolution = resolution
+        if fps:
+            self.video_fps = fps
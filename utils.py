@@ -1,21 +1,406 @@
+import asyncio
+import collections
+import struct
+import time
+
 import cv2
 import numpy as np
 
-def encode_frame(frame, quality=60):
+try:
+    import av
+except ImportError:
+    # PyAV is optional; without it the H.264 codec simply isn't offered
+    av = None
+
+def fit_size(frame, size):
+    """
+    Downscales frame to size (width, height) unless it already matches (or size is None).
+    """
+    if size is not None and (frame.shape[1], frame.shape[0]) != tuple(size):
+        frame = cv2.resize(frame, tuple(size), interpolation=cv2.INTER_AREA)
+    return frame
+
+def encode_frame(frame, quality=60, size=None):
     """
     Encodes a raw frame to JPEG format (bytes).
+    If size (width, height) is given and differs from the frame, it is downscaled first.
     """
+    frame = fit_size(frame, size)
     encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
     ret, jpeg = cv2.imencode('.jpg', frame, encode_param)
     return jpeg.tobytes()
 
-def decode_frame(frame_bytes):
+# libjpeg can decode straight to 1/2, 1/4 or 1/8 size, skipping most of the IDCT work
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+def decode_frame(frame_bytes, reduce=1):
     """
-    Decodes JPEG bytes back to a raw frame.
+    Decodes JPEG bytes back to a raw frame, at 1/reduce size (1, 2, 4 or 8).
     """
     nparr = np.frombuffer(frame_bytes, np.uint8)
-    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    frame = cv2.imdecode(nparr, REDUCED_DECODE_FLAGS[reduce])
+    return frame
+
+def reduce_factor(frame_size, view_size):
+    """
+    Largest JPEG reduction (1, 2, 4 or 8) that still covers view_size,
+    so small tiles don't pay for full-resolution decodes.
+    """
+    if not frame_size or not view_size:
+        return 1
+    for factor in (8, 4, 2):
+        if frame_size[0] // factor >= view_size[0] and frame_size[1] // factor >= view_size[1]:
+            return factor
+    return 1
+
+# Tile updates start with a NUL byte, so they can never be mistaken for a JPEG (0xFF 0xD8)
+TILE_MAGIC = b"\x00VT"
+TILE_HEADER = struct.Struct("!3sHHBH") # magic, frame width, frame height, tile size, tile count
+MOSAIC_COLUMNS = 16
+
+def is_tile_update(payload):
+    return payload[:3] == TILE_MAGIC
+
+def changed_tiles(frame, reference, tile=32, step=4, pixel_threshold=20, min_pixels=2):
+    """
+    Returns a (rows, cols) boolean mask of tiles that differ between two frames.
+    Works on a 1/step subsample so the comparison is a few vectorized passes over
+    a small array: a tile counts as changed when at least min_pixels of its
+    sampled pixels moved by more than pixel_threshold on any channel.
+    """
+    small = frame[::step, ::step].astype(np.int16)
+    small -= reference[::step, ::step]
+    moved = (np.abs(small).max(axis=2) > pixel_threshold)
+
+    block = tile // step
+    rows = -(-frame.shape[0] // tile)
+    cols = -(-frame.shape[1] // tile)
+    moved = np.pad(moved, ((0, rows * block - moved.shape[0]), (0, cols * block - moved.shape[1])))
+    counts = moved.reshape(rows, block, cols, block).sum(axis=(1, 3))
+    return counts >= min_pixels
+
+def encode_tiles(frame, mask, tile=32, quality=60):
+    """
+    Packs the tiles selected by mask into one mosaic image and JPEG-encodes it once,
+    prefixed with the tile coordinates. Tiles are multiples of the JPEG MCU size,
+    so compression artifacts never bleed between neighbouring tiles.
+    """
+    height, width = frame.shape[:2]
+    coords = np.argwhere(mask).astype(">u2")
+    count = len(coords)
+    mosaic_cols = min(count, MOSAIC_COLUMNS)
+    mosaic_rows = -(-count // mosaic_cols)
+    mosaic = np.zeros((mosaic_rows * tile, mosaic_cols * tile, 3), dtype=np.uint8)
+
+    for i, (row, col) in enumerate(coords):
+        src = frame[row * tile:(row + 1) * tile, col * tile:(col + 1) * tile]
+        y, x = (i // mosaic_cols) * tile, (i % mosaic_cols) * tile
+        mosaic[y:y + src.shape[0], x:x + src.shape[1]] = src
+
+    header = TILE_HEADER.pack(TILE_MAGIC, width, height, tile, count)
+    return header + coords.tobytes() + encode_frame(mosaic, quality)
+
+def apply_tiles(payload, reference):
+    """
+    Decodes a tile update and returns a new frame: reference with the tiles replaced.
+    reference itself is left untouched, since it may still be on screen.
+    Returns None if the update doesn't fit the reference.
+    """
+    magic, width, height, tile, count = TILE_HEADER.unpack_from(payload)
+    if reference is None or reference.shape[:2] != (height, width):
+        return None
+    start = TILE_HEADER.size
+    coords = np.frombuffer(payload, dtype=">u2", count=count * 2, offset=start).reshape(count, 2)
+    mosaic = decode_frame(memoryview(payload)[start + count * 4:])
+    if mosaic is None:
+        return None
+
+    frame = reference.copy()
+    mosaic_cols = min(count, MOSAIC_COLUMNS)
+    for i, (row, col) in enumerate(coords):
+        dst = frame[row * tile:(row + 1) * tile, col * tile:(col + 1) * tile]
+        y, x = (i // mosaic_cols) * tile, (i % mosaic_cols) * tile
+        dst[...] = mosaic[y:y + dst.shape[0], x:x + dst.shape[1]]
     return frame
 
+class Codec:
+    """
+    Interface for video codecs. One instance handles one direction of a stream:
+    encoders may keep state between frames (inter-frame codecs), and so may decoders.
+    """
+    name = None
+    # Whether decode() can produce a reduced-size frame cheaply
+    supports_reduce = False
+
+    def configure(self, **options):
+        """
+        Applies codec-specific settings (e.g. keyframe_interval).
+        """
+        for key, value in options.items():
+            if not hasattr(self, key):
+                raise ValueError(f"{self.name} codec has no option '{key}'")
+            setattr(self, key, value)
+
+    def encode(self, frame, quality=60, size=None):
+        """
+        Returns the payload to send, or None if there is nothing worth sending.
+        """
+        raise NotImplementedError
+
+    def decode(self, payload, reduce=1):
+        """
+        Returns the decoded BGR frame, or None if it can't be rebuilt yet.
+        Codecs that can decode at reduced size (JPEG) honour reduce; others ignore it.
+        """
+        raise NotImplementedError
+
+    def request_keyframe(self):
+        """
+        Makes the next encoded frame decodable on its own.
+        """
+
+    def is_keyframe(self, payload):
+        """
+        True if payload doesn't depend on earlier frames, i.e. the receiver
+        may skip anything queued before it.
+        """
+        return True
+
+class JpegCodec(Codec):
+    """
+    Every frame is an independent JPEG (MJPEG).
+    """
+    name = "jpeg"
+    supports_reduce = True
+
+    def encode(self, frame, quality=60, size=None):
+        return encode_frame(frame, quality, size)
+
+    def decode(self, payload, reduce=1):
+        return decode_frame(payload, reduce)
+
+class DeltaCodec(Codec):
+    """
+    Sends a full JPEG keyframe, then only the tiles that changed since the last
+    sent frame, and nothing at all when the picture is static.
+    Talking-head content mostly falls in the last two cases.
+    """
+    name = "delta"
+
+    def __init__(self, tile=32, keyframe_interval=60, max_changed=0.5):
+        self.tile = tile
+        self.keyframe_interval = keyframe_interval
+        # Above this share of changed tiles a keyframe is cheaper than a mosaic
+        self.max_changed = max_changed
+        # Encoder: what the receiver currently shows. Decoder: the last rebuilt frame.
+        self.reference = None
+        self.since_keyframe = 0
+        self.frames_skipped = 0
+
+    def request_keyframe(self):
+        self.reference = None
+
+    def is_keyframe(self, payload):
+        return not is_tile_update(payload)
+
+    def encode(self, frame, quality=60, size=None):
+        frame = fit_size(frame, size)
+        reference = self.reference
+        if (reference is None or reference.shape != frame.shape
+                or self.since_keyframe >= self.keyframe_interval):
+            return self._keyframe(frame, quality)
+
+        mask = changed_tiles(frame, reference, self.tile)
+        changed = int(mask.sum())
+        if changed == 0:
+            self.frames_skipped += 1
+            return None
+        if changed > self.max_changed * mask.size:
+            return self._keyframe(frame, quality)
+
+        self.since_keyframe += 1
+        payload = encode_tiles(frame, mask, self.tile, quality)
+        # Track what the receiver now shows; unchanged tiles keep their old pixels
+        tile = self.tile
+        for row, col in np.argwhere(mask):
+            area = (slice(row * tile, (row + 1) * tile), slice(col * tile, (col + 1) * tile))
+            reference[area] = frame[area]
+        return payload
+
+    def _keyframe(self, frame, quality):
+        self.reference = frame.copy()
+        self.since_keyframe = 0
+        return encode_frame(frame, quality)
+
+    def decode(self, payload, reduce=1):
+        # The reference must stay full size for tiles to land in place, so reduce is ignored.
+        # Tile updates only make sense in order, so none may be skipped after a keyframe
+        if is_tile_update(payload):
+            frame = apply_tiles(payload, self.reference)
+        else:
+            frame = decode_frame(payload)
+        if frame is not None:
+            self.reference = frame
+        return frame
+
+class AVCodec(Codec):
+    """
+    H.264 through PyAV (optional dependency), tuned for low latency:
+    no B-frames, one packet per frame. Payloads carry a one-byte keyframe flag.
+    """
+    name = "h264"
+    KEY = b"K"
+    DELTA = b"D"
+
+    def __init__(self, keyframe_interval=60, preset="ultrafast"):
+        self.keyframe_interval = keyframe_interval
+        self.preset = preset
+        self.encoder = None
+        self.decoder = None
+        self.encoder_key = None
+        self.force_keyframe = False
+
+    def request_keyframe(self):
+        self.force_keyframe = True
+
+    def is_keyframe(self, payload):
+        return payload[:1] == self.KEY
+
+    def _open_encoder(self, width, height, quality):
+        encoder = av.CodecContext.create("libx264", "w")
+        encoder.width = width
+        encoder.height = height
+        encoder.pix_fmt = "yuv420p"
+        encoder.gop_size = self.keyframe_interval
+        encoder.max_b_frames = 0
+        # Map JPEG-style quality (0-100, higher is better) onto x264's CRF (51-0, lower is better)
+        crf = max(0, min(51, round(51 - quality * 0.45)))
+        encoder.options = {"preset": self.preset, "tune": "zerolatency", "crf": str(crf)}
+        encoder.open()
+        self.encoder = encoder
+        self.encoder_key = (width, height, quality)
+
+    def encode(self, frame, quality=60, size=None):
+        frame = fit_size(frame, size)
+        height, width = frame.shape[:2]
+        if self.encoder is None or self.encoder_key != (width, height, quality):
+            # A fresh encoder always starts with a keyframe
+            self._open_encoder(width, height, quality)
+
+        av_frame = av.VideoFrame.from_ndarray(frame, format="bgr24")
+        if self.force_keyframe:
+            av_frame.pict_type = av.video.frame.PictureType.I
+            self.force_keyframe = False
+
+        packets = self.encoder.encode(av_frame)
+        if not packets:
+            return None
+        flag = self.KEY if any(packet.is_keyframe for packet in packets) else self.DELTA
+        return flag + b"".join(bytes(packet) for packet in packets)
+
+    def decode(self, payload, reduce=1):
+        if self.decoder is None:
+            self.decoder = av.CodecContext.create("h264", "r")
+        frame = None
+        for packet in self.decoder.parse(bytes(memoryview(payload)[1:])):
+            for av_frame in self.decoder.decode(packet):
+                frame = av_frame.to_ndarray(format="bgr24")
+        return frame
+
+CODECS = {codec.name: codec for codec in (JpegCodec, DeltaCodec)}
+if av is not None:
+    CODECS[AVCodec.name] = AVCodec
+
+# Best quality per byte first; JPEG is the fallback every peer understands
+CODEC_PREFERENCE = ["h264", "delta", "jpeg"]
+
+def available_codecs():
+    """
+    Names of the codecs usable in this install, in preference order.
+    """
+    return [name for name in CODEC_PREFERENCE if name in CODECS]
+
+def create_codec(name, **options):
+    codec = CODECS[name]()
+    codec.configure(**options)
+    return codec
+
+def negotiate_codec(receiver_codecs, sender_codecs):
+    """
+    Picks the codec for one direction of a call: the receiver's most preferred
+    codec that the sender also supports. Both peers compute this from the same
+    two lists, so they agree without another round trip.
+    """
+    for name in receiver_codecs:
+        if name in sender_codecs and name in CODECS:
+            return name
+    return JpegCodec.name
+
 # Framing helpers (send_all, recv_all) are NOT needed for WebSockets
 # as WebSockets handles message boundaries automatically.
+
+class FramePacer:
+    """
+    Paces a capture loop to a target FPS on the monotonic clock.
+    Deadlines advance by a fixed interval, so time spent encoding/sending is
+    absorbed instead of added on top. When the loop falls a whole interval
+    behind, the missed ticks are skipped rather than replayed in a burst.
+    """
+    def __init__(self, fps=15, window=30):
+        self.intervals = collections.deque(maxlen=window)
+        self.set_fps(fps)
+        self.reset()
+
+    def set_fps(self, fps):
+        self.fps = fps
+        self.interval = 1.0 / fps
+
+    def reset(self):
+        self.next_tick = None
+        self.last_tick = None
+        self.frames_skipped = 0
+        self.intervals.clear()
+
+    async def wait(self):
+        """
+        Sleeps until the next tick is due.
+        """
+        now = time.monotonic()
+        if self.next_tick is None:
+            self.next_tick = now
+
+        delay = self.next_tick - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+        elif -delay >= self.interval:
+            # Too far behind: drop the ticks we missed to avoid accumulating lag
+            missed = int(-delay / self.interval)
+            self.frames_skipped += missed
+            self.next_tick += missed * self.interval
+
+        now = time.monotonic()
+        if self.last_tick is not None:
+            self.intervals.append(now - self.last_tick)
+        self.last_tick = now
+        self.next_tick += self.interval
+
+    def achieved_fps(self):
+        """
+        Frame rate actually delivered over the recent window.
+        """
+        if not self.intervals:
+            return 0.0
+        return len(self.intervals) / sum(self.intervals)
+
+    def jitter(self):
+        """
+        Mean absolute deviation of tick intervals from the target, in seconds.
+        """
+        if not self.intervals:
+            return 0.0
+        return sum(abs(i - self.interval) for i in self.intervals) / len(self.intervals)
@@ -1,42 +1,416 @@
 import cv2
+import glob
+import os
+import numpy as np
+from PyQt6.QtGui import QImage
 
 import threading
+import time
 
-class VideoCamera:
+class VideoFrame:
     """
-    Handles video capture from the webcam using OpenCV.
-    Thread-safe.
+    A BGR frame together with the QImage that views its pixels.
+    QImage(data, ...) doesn't copy, so the numpy buffer must outlive the image:
+    keeping both on one object (passed around instead of a bare QImage) makes
+    that hold without a cvtColor pass or a deep copy.
     """
-    def __init__(self, source=0):
-        self.cap = cv2.VideoCapture(source)
-        if not self.cap.isOpened():
-            raise ValueError("Could not open video source")
-        
-        # Set resolution to 640x480
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+    __slots__ = ("array", "image", "timestamp", "decoded_at", "stream_id")
+
+    def __init__(self, array, timestamp=0, stream_id=0):
+        height, width = array.shape[:2]
+        self.array = array
+        self.stream_id = stream_id
+        # Capture time on the sender (wall clock, microseconds) and when we finished decoding
+        self.timestamp = timestamp
+        self.decoded_at = time.monotonic()
+        # Format_BGR888 lets Qt read OpenCV's channel order directly
+        self.image = QImage(array.data, width, height, array.strides[0], QImage.Format.Format_BGR888)
+
+    def width(self):
+        return self.image.width()
+
+    def height(self):
+        return self.image.height()
+
+
+def fit_within(size, bounds):
+    """
+    Largest (width, height) with the aspect ratio of size that fits in bounds.
+    Never upscales: a size that already fits is returned unchanged.
+    """
+    width, height = size
+    scale = min(bounds[0] / width, bounds[1] / height, 1.0)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+class FrameRingBuffer:
+    """
+    Fixed-size ring of preallocated frame slots.
+    A single producer writes into the next free slot and publishes it;
+    any number of consumers can grab the latest frame without blocking.
+    """
+    def __init__(self, width, height, depth=4):
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.slots = [np.zeros((height, width, 3), dtype=np.uint8) for _ in range(depth)]
+        self.timestamps = [0.0] * depth
+        # Sequence number of the latest published frame (0 = nothing yet)
+        self.seq = 0
         self.lock = threading.Lock()
 
-    def get_frame(self):
+    def next_slot(self):
+        """
+        Returns the slot the producer should write the next frame into.
         """
-        Reads a frame from the camera, resizing if necessary.
-        Returns the raw frame (numpy array) or None if failed.
+        return self.slots[(self.seq + 1) % self.depth]
+
+    def publish(self, timestamp):
+        """
+        Marks the slot returned by next_slot() as the latest frame.
         """
         with self.lock:
-            if not self.cap.isOpened():
-                return None
-                
-            ret, frame = self.cap.read()
-            if not ret:
+            self.seq += 1
+            self.timestamps[self.seq % self.depth] = timestamp
+
+    def latest(self):
+        """
+        Returns (seq, timestamp, frame) for the newest frame, or (0, 0.0, None).
+        The frame is a view into the ring: it stays valid until the producer
+        wraps around, i.e. for (depth - 1) more captures.
+        """
+        with self.lock:
+            seq = self.seq
+        if seq == 0:
+            return 0, 0.0, None
+        index = seq % self.depth
+        return seq, self.timestamps[index], self.slots[index]
+
+
+class DeviceSource:
+    """
+    A webcam, by OpenCV device index. Reads block until the device delivers a frame.
+    All sources share this interface: open(width, height, fps), read(dst), close(),
+    plus size (after open), fps (native rate, for paced sources) and realtime.
+    """
+    realtime = True
+
+    def __init__(self, index=0):
+        self.index = index
+        self.cap = None
+        self.size = None
+        self.fps = None
+
+    def open(self, width, height, fps=None):
+        self.cap = cv2.VideoCapture(self.index)
+        if not self.cap.isOpened():
+            raise ValueError("Could not open video source")
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if fps:
+            self.cap.set(cv2.CAP_PROP_FPS, fps)
+        # What the device actually agreed to (some backends ignore the request)
+        self.size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                     int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+    def read(self, dst):
+        """
+        Returns the next frame, written into dst when the sizes match, or None.
+        """
+        ret, frame = self.cap.read(dst)
+        return frame if ret else None
+
+    def close(self):
+        if self.cap is not None and self.cap.isOpened():
+            self.cap.release()
+
+
+class FileSource(DeviceSource):
+    """
+    A video file played as a camera at the file's native frame rate, looping at the end.
+    Closing and reopening (camera off/on) resumes where it stopped.
+    """
+    realtime = False
+
+    def __init__(self, path, loop=True):
+        super().__init__()
+        self.path = path
+        self.loop = loop
+        self.position = 0
+
+    def open(self, width, height, fps=None):
+        self.cap = cv2.VideoCapture(self.path)
+        if not self.cap.isOpened():
+            raise ValueError(f"Could not open video file {self.path}")
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.position)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+        self.size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                     int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+    def read(self, dst):
+        ret, frame = self.cap.read(dst)
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read(dst)
+        return frame if ret else None
+
+    def close(self):
+        if self.cap is not None and self.cap.isOpened():
+            self.position = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+        super().close()
+
+
+class ImageSequenceSource:
+    """
+    Numbered still images (a directory, or a glob such as "frames/*.png") played
+    in name order as a camera at fps, looping at the end.
+    """
+    realtime = False
+    EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+    def __init__(self, path, fps=30, loop=True):
+        if os.path.isdir(path):
+            files = [os.path.join(path, name) for name in os.listdir(path)]
+            files = [f for f in files if f.lower().endswith(self.EXTENSIONS)]
+        else:
+            files = glob.glob(path)
+        self.files = sorted(files)
+        self.fps = fps
+        self.loop = loop
+        self.index = 0
+        self.size = None
+
+    def open(self, width, height, fps=None):
+        if not self.files:
+            raise ValueError("Image sequence is empty")
+        first = cv2.imread(self.files[0])
+        if first is None:
+            raise ValueError(f"Could not read {self.files[0]}")
+        self.size = (first.shape[1], first.shape[0])
+
+    def read(self, dst):
+        if self.index >= len(self.files):
+            if not self.loop:
                 return None
-            
-            # Ensure frame is resized to standard size
-            frame = cv2.resize(frame, (640, 480))
-            return frame
+            self.index = 0
+        frame = cv2.imread(self.files[self.index])
+        self.index += 1
+        return frame
+
+    def close(self):
+        pass
+
+
+class TestPatternSource:
+    """
+    Procedural frames, generated straight into the ring at the capture size:
+    "gradient" (colour ramps scrolling at different speeds), "noise" (seeded random
+    pixels, the worst case for every codec) or "static" (one unchanging picture).
+    Deterministic for a given pattern and seed, for repeatable benchmarks.
+    """
+    realtime = False
+    PATTERNS = ("gradient", "noise", "static")
+
+    def __init__(self, pattern="gradient", fps=30, seed=0):
+        if pattern not in self.PATTERNS:
+            raise ValueError(f"Unknown test pattern: {pattern}")
+        self.pattern = pattern
+        self.fps = fps
+        self.seed = seed
+        self.size = None
+
+    def open(self, width, height, fps=None):
+        self.size = (width, height)
+        self.tick = 0
+        self.rng = np.random.default_rng(self.seed)
+        self.x_ramp = (np.arange(width) * 256 // width).astype(np.uint8)[np.newaxis, :]
+        self.y_ramp = (np.arange(height) * 256 // height).astype(np.uint8)[:, np.newaxis]
+        self.still = np.zeros((height, width, 3), dtype=np.uint8)
+        self.still[:] = (90, 90, 90)
+        self.still[height // 4:height // 2, width // 4:width // 2] = (0, 0, 255)
+
+    def read(self, dst):
+        if self.pattern == "static":
+            np.copyto(dst, self.still)
+        elif self.pattern == "noise":
+            dst[:] = np.frombuffer(self.rng.bytes(dst.size), dtype=np.uint8).reshape(dst.shape)
+        else:
+            # uint8 arithmetic wraps, which is exactly the scrolling we want
+            t = self.tick
+            dst[:, :, 0] = self.x_ramp + np.uint8(t * 4 % 256)
+            dst[:, :, 1] = self.y_ramp + np.uint8(t * 2 % 256)
+            dst[:, :, 2] = (self.x_ramp >> 1) + (self.y_ramp >> 1) + np.uint8(t * 3 % 256)
+        self.tick += 1
+        return dst
+
+    def close(self):
+        pass
+
+
+def open_source(spec=0):
+    """
+    Builds a camera source from a setting: a device index (int or digits),
+    "test" or "test:<pattern>" for a test pattern, a directory or glob for an
+    image sequence, any other string for a video file. Source objects pass through.
+    """
+    if isinstance(spec, int):
+        return DeviceSource(spec)
+    if not isinstance(spec, str):
+        return spec
+    if spec.isdigit():
+        return DeviceSource(int(spec))
+    if spec == "test" or spec.startswith("test:"):
+        _, _, pattern = spec.partition(":")
+        return TestPatternSource(pattern or "gradient")
+    if os.path.isdir(spec) or glob.has_magic(spec):
+        return ImageSequenceSource(spec)
+    return FileSource(spec)
+
+
+class VideoCamera:
+    """
+    Handles video capture using OpenCV, from a webcam or any source open_source() knows.
+    A dedicated thread reads the device at its native rate into a ring buffer,
+    so the preview and the network sender never block on (or steal from) each other;
+    files, image sequences and test patterns are paced to their own frame rate.
+    width/height/fps are the call's capture settings; each frame is resized to them
+    at most once, and a smaller preview copy is made in the same pass if one was asked for.
+    """
+    def __init__(self, source=0, width=640, height=480, fps=None, buffer_depth=4):
+        self.source = open_source(source)
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self._open()
+
+        self.buffer_depth = buffer_depth
+        self.buffer = FrameRingBuffer(width, height, buffer_depth)
+        # Preview-sized copies for the local tile (None = preview uses the full frame)
+        self.preview = None
+        self.running = True
+        # Cleared while the camera is switched off; the capture thread waits on it
+        self.active = threading.Event()
+        self.active.set()
+        self.thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.thread.start()
+
+    def _open(self):
+        self.source.open(self.width, self.height, self.fps)
+        # Corrected from the first frame if the source doesn't report it
+        self.device_size = self.source.size
+
+    def pause(self):
+        """
+        Switches the camera off: the capture thread closes the device (its light
+        goes out) and sleeps until resume(). get_latest() keeps returning the last frame.
+        """
+        self.active.clear()
+
+    def resume(self):
+        self.active.set()
+
+    @property
+    def paused(self):
+        return not self.active.is_set()
+
+    def _capture_loop(self):
+        """
+        Producer: reads frames straight into the ring when the source
+        already delivers the target size, otherwise resizes into the slot.
+        The preview ring, if any, is filled from the slot while it's still in cache.
+        """
+        scratch = None
+        deadline = time.monotonic()
+        while self.running:
+            if not self.active.is_set():
+                self.source.close()
+                self.active.wait()
+                if not self.running:
+                    break
+                try:
+                    self._open()
+                except ValueError as e:
+                    print(f"Camera Error: {e}")
+                    self.active.clear()
+                    continue
+                scratch = None
+                deadline = time.monotonic()
+            slot = self.buffer.next_slot()
+            target = slot if scratch is None else scratch
+            frame = self.source.read(target)
+            if frame is None:
+                time.sleep(0.01)
+                continue
+            timestamp = time.monotonic()
+
+            if frame is not slot:
+                if frame.shape != slot.shape:
+                    # Source doesn't deliver our size; keep a scratch buffer for reads
+                    scratch = frame
+                    self.device_size = (frame.shape[1], frame.shape[0])
+                    cv2.resize(frame, (self.width, self.height), dst=slot, interpolation=cv2.INTER_AREA)
+                else:
+                    np.copyto(slot, frame)
+
+            preview = self.preview
+            if preview is not None:
+                cv2.resize(slot, (preview.width, preview.height), dst=preview.next_slot(),
+                           interpolation=cv2.INTER_AREA)
+                preview.publish(timestamp)
+            self.buffer.publish(timestamp)
+
+            if not self.source.realtime:
+                # Play files and generated frames at their own rate, without drift
+                deadline += 1 / (self.source.fps or self.fps or 30)
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -0.1:
+                    deadline = time.monotonic()
+
+    def set_preview_size(self, width, height):
+        """
+        Asks for preview frames that fit in width x height (keeping the aspect ratio).
+        A size at or above the capture size turns the extra copy off.
+        """
+        size = fit_within((self.width, self.height), (max(width, 1), max(height, 1)))
+        if size == (self.width, self.height):
+            self.preview = None
+        elif self.preview is None or size != (self.preview.width, self.preview.height):
+            # Swapped in whole, so the capture thread never sees a half-built ring
+            self.preview = FrameRingBuffer(size[0], size[1], self.buffer_depth)
+
+    def get_latest(self):
+        """
+        Returns (seq, timestamp, frame) for the newest captured frame without blocking.
+        Consumers can compare seq with the last one they handled to skip duplicates.
+        """
+        return self.buffer.latest()
+
+    def get_frame(self):
+        """
+        Returns the latest raw frame (numpy array) or None if nothing was captured yet.
+        """
+        return self.buffer.latest()[2]
+
+    def get_preview(self):
+        """
+        Returns the latest frame at preview size (see set_preview_size), or None.
+        """
+        preview = self.preview
+        if preview is not None:
+            frame = preview.latest()[2]
+            if frame is not None:
+                return frame
+        return self.get_frame()
 
     def release(self):
         """
-        Releases the camera resource.
+        Stops the capture thread and releases the camera resource.
         """
-        if self.cap.isOpened():
-            self.cap.release()
+        self.running = False
+        # Wake the thread if the camera is paused, so it can exit
+        self.active.set()
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        self.source.close()
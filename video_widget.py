@@ -0,0 +1,78 @@
+from PyQt6.QtWidgets import QWidget, QSizePolicy
+from PyQt6.QtCore import Qt, QRect, pyqtSignal
+from PyQt6.QtGui import QPainter, QColor
+
+class VideoWidget(QWidget):
+    """
+    Draws the latest VideoFrame straight from its QImage in paintEvent.
+    Unlike QLabel.setPixmap there is no pixmap conversion, no scaled copy and no
+    relayout per frame: set_frame() only stores the frame and calls update(), which
+    Qt coalesces, so several frames arriving between repaints cost a single paint.
+    """
+    # Emitted with each frame that actually reached the screen
+    frame_painted = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.frame = None
+        self.background = QColor("black")
+        # Shown instead of video while there's no frame (e.g. "Camera off")
+        self.placeholder = ""
+        # Letterboxed area the frame is drawn into; recomputed on resize or frame size change
+        self.target_rect = QRect()
+        self._frame_size = None
+        self._painted = True
+        # We paint every pixel ourselves, so Qt needn't clear the background first
+        self.setAttribute(Qt.WidgetAttribute.WA_OpaquePaintEvent)
+        self.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
+
+    def set_frame(self, video_frame):
+        """
+        Shows video_frame on the next repaint. Keeps a reference to it, since
+        its QImage views the frame's pixel buffer.
+        """
+        self.frame = video_frame
+        self.placeholder = ""
+        self._painted = False
+        size = (video_frame.width(), video_frame.height())
+        if size != self._frame_size:
+            self._frame_size = size
+            self._update_target_rect()
+        self.update()
+
+    def clear(self, placeholder=""):
+        self.frame = None
+        self._frame_size = None
+        self.placeholder = placeholder
+        self.update()
+
+    def _update_target_rect(self):
+        if self._frame_size is None:
+            self.target_rect = QRect()
+            return
+        fw, fh = self._frame_size
+        w, h = self.width(), self.height()
+        scale = min(w / fw, h / fh)
+        tw, th = int(fw * scale), int(fh * scale)
+        self.target_rect = QRect((w - tw) // 2, (h - th) // 2, tw, th)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._update_target_rect()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        if self.frame is None or self.target_rect.isEmpty():
+            painter.fillRect(self.rect(), self.background)
+            if self.frame is None and self.placeholder:
+                painter.setPen(QColor("#9aa0a6"))
+                painter.drawText(self.rect(), Qt.AlignmentFlag.AlignCenter, self.placeholder)
+            return
+        # Background only matters when the frame is letterboxed; drawImage scales into the cached rect
+        if self.target_rect != self.rect():
+            painter.fillRect(self.rect(), self.background)
+        painter.drawImage(self.target_rect, self.frame.image)
+        painter.end()
+        if not self._painted:
+            self._painted = True
+            self.frame_painted.emit(self.frame)